@@ -0,0 +1,358 @@
+"""Offline emotion detection over recorded videos and image folders.
+
+Usage:
+    python batch_process.py recordings/*.mp4 --output results.csv
+    python batch_process.py photos/ --output results.jsonl --workers 8
+    python batch_process.py lecture.mp4 --output results.parquet --frame-step 5 --include-empty
+    python batch_process.py recordings/ --output results.csv --resume
+
+Inputs are video files, image files or directories of either. Each input is
+split into work units (`--chunk-size` frames or images) that a process pool
+decodes, runs face detection on and classifies. Faces from all frames of a unit
+are gathered into `--batch-size` batches for the CNN. Each worker loads its own
+model and face detector once (see inference_backends.py / face_detectors.py).
+
+Results are written one row per face: source, frame, timestamp, face index,
+box, top emotion, confidence and the probability of every emotion. Output
+format follows the extension: .csv, .jsonl or .parquet (Parquet needs
+`pyarrow`; rows are staged as JSONL and converted when the run finishes).
+
+Progress is checkpointed to `<output>.checkpoint.json` after every unit, along
+with the output size at that point. With `--resume`, finished units are
+skipped and any partially written rows past the checkpoint are truncated, so an
+interrupted run continues without duplicates.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+import cv2
+import numpy as np
+from face_preprocessing import FacePreprocessor, to_gray
+
+EMOTION_LABELS = ['Angry', 'Disgust', 'Fear', 'Happy', 'Sad', 'Surprise', 'Neutral']
+
+VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mov', '.mkv', '.webm', '.m4v', '.mpg', '.mpeg', '.wmv'}
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp'}
+
+FIELDS = ['source', 'frame', 'timestamp', 'face', 'x', 'y', 'w', 'h', 'emotion', 'confidence'] + \
+    [label.lower() for label in EMOTION_LABELS]
+
+
+# ---------------------------------------------------------------------------
+# Work units
+# ---------------------------------------------------------------------------
+
+def collect_inputs(paths):
+    """Expand paths into (videos, images): sorted lists of file paths."""
+    videos, images = [], []
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+        else:
+            files = [path]
+        for f in files:
+            ext = os.path.splitext(f)[1].lower()
+            if ext in VIDEO_EXTENSIONS:
+                videos.append(f)
+            elif ext in IMAGE_EXTENSIONS:
+                images.append(f)
+    return videos, images
+
+
+def plan_units(videos, images, chunk_size, frame_step=1):
+    """Split inputs into work units of at most `chunk_size` frames or images.
+
+    A unit is a dict with a stable 'key' used for checkpointing: videos are
+    cut into [start, stop) frame ranges, images into consecutive groups.
+    """
+    units = []
+    span = chunk_size * frame_step
+    for path in videos:
+        cap = cv2.VideoCapture(path)
+        frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        cap.release()
+        if frames <= 0:
+            print(f'Skipping {path}: could not read frame count')
+            continue
+        for start in range(0, frames, span):
+            stop = min(start + span, frames)
+            units.append({'key': f'{path}#{start}-{stop}', 'kind': 'video', 'path': path,
+                          'start': start, 'stop': stop, 'step': frame_step, 'fps': fps})
+    for i in range(0, len(images), chunk_size):
+        group = images[i:i + chunk_size]
+        units.append({'key': f'images#{group[0]}#{len(group)}', 'kind': 'images', 'paths': group})
+    return units
+
+
+def iter_frames(unit):
+    """Yield (source, frame_index, timestamp, BGR image) for a work unit."""
+    if unit['kind'] == 'images':
+        for path in unit['paths']:
+            image = cv2.imread(path)
+            if image is None:
+                print(f'Could not read {path}')
+                continue
+            yield path, 0, None, image
+        return
+
+    cap = cv2.VideoCapture(unit['path'])
+    cap.set(cv2.CAP_PROP_POS_FRAMES, unit['start'])
+    fps = unit['fps']
+    try:
+        for index in range(unit['start'], unit['stop']):
+            # grab() skips decoding the frames we don't sample
+            if not cap.grab():
+                break
+            if (index - unit['start']) % unit['step']:
+                continue
+            ok, frame = cap.retrieve()
+            if not ok:
+                break
+            yield unit['path'], index, round(index / fps, 3) if fps else None, frame
+    finally:
+        cap.release()
+
+
+# ---------------------------------------------------------------------------
+# Worker processes
+# ---------------------------------------------------------------------------
+
+_worker = {}
+
+
+def init_worker(model_path, detector, detector_options, batch_size, include_empty, threads):
+    """Pool initializer: load the model and face detector once per process."""
+    cv2.setNumThreads(1)  # parallelism comes from the pool
+    if threads:
+        os.environ.setdefault('OMP_NUM_THREADS', str(threads))
+        os.environ.setdefault('TF_NUM_INTRAOP_THREADS', str(threads))
+    from inference_backends import load_model
+    from face_detectors import create_detector
+    _worker['model'] = load_model(model_path, warmup=True)
+    _worker['detector'] = create_detector(detector, **detector_options)
+    _worker['preprocessor'] = FacePreprocessor(batch_size)
+    _worker['batch_size'] = batch_size
+    _worker['include_empty'] = include_empty
+
+
+def classify_crops(model, preprocessor, crops, batch_size):
+    """Classify uint8 (N, 48, 48) crops in batches of at most `batch_size`."""
+    probs = []
+    for i in range(0, len(crops), batch_size):
+        batch = preprocessor.normalize(crops[i:i + batch_size])
+        probs.append(np.asarray(model.predict(batch, verbose=0)))
+    return np.concatenate(probs) if probs else np.empty((0, len(EMOTION_LABELS)), dtype=np.float32)
+
+
+def process_unit(unit):
+    """Detect and classify every face in a work unit; returns (key, rows, frames)."""
+    model = _worker['model']
+    detector = _worker['detector']
+    batch_size = _worker['batch_size']
+
+    preprocessor = _worker['preprocessor']
+
+    faces, crops, empty = [], [], []
+    frames = 0
+    for source, index, timestamp, image in iter_frames(unit):
+        frames += 1
+        gray = to_gray(image)
+        boxes = detector.detect(image if detector.needs_color else gray)
+        if not len(boxes):
+            empty.append((source, index, timestamp))
+        for n, (x, y, w, h) in enumerate(boxes):
+            faces.append((source, index, timestamp, n, int(x), int(y), int(w), int(h)))
+        # The preprocessor's crop buffer is reused on the next frame, so keep a copy
+        crops.append(preprocessor.crop(gray, boxes).copy())
+
+    # Faces from all frames of the unit go through the model together
+    crops = np.concatenate(crops) if crops else np.empty((0, 48, 48), dtype=np.uint8)
+    probs = classify_crops(model, preprocessor, crops, batch_size)
+    rows = []
+    for (source, index, timestamp, n, x, y, w, h), p in zip(faces, probs):
+        top = int(np.argmax(p))
+        row = {'source': source, 'frame': index, 'timestamp': timestamp, 'face': n,
+               'x': x, 'y': y, 'w': w, 'h': h, 'emotion': EMOTION_LABELS[top], 'confidence': round(float(p[top]), 4)}
+        row.update({label.lower(): round(float(v), 4) for label, v in zip(EMOTION_LABELS, p)})
+        rows.append(row)
+    if _worker['include_empty']:
+        for source, index, timestamp in empty:
+            rows.append({'source': source, 'frame': index, 'timestamp': timestamp})
+        rows.sort(key=lambda r: (r['source'], r['frame'], r.get('face', -1)))
+    return unit['key'], rows, frames
+
+
+# ---------------------------------------------------------------------------
+# Output and checkpoints
+# ---------------------------------------------------------------------------
+
+class CSVOutput:
+    def __init__(self, path, offset=0):
+        self.path = path
+        self.file = _open_at(path, offset, newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=FIELDS)
+        if self.file.tell() == 0:
+            self.writer.writeheader()
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def flush(self):
+        """Flush to disk and return the current file size."""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self, finished):
+        self.file.close()
+
+
+class JSONLOutput(CSVOutput):
+    def __init__(self, path, offset=0):
+        self.path = path
+        self.file = _open_at(path, offset)
+
+    def write(self, rows):
+        for row in rows:
+            self.file.write(json.dumps(row) + '\n')
+
+
+class ParquetOutput(JSONLOutput):
+    """Rows are staged as JSONL next to the output and converted when the run finishes."""
+
+    def __init__(self, path, offset=0):
+        import pyarrow  # noqa: F401  fail early if Parquet output is unavailable
+        self.parquet_path = path
+        super().__init__(path + '.rows.jsonl', offset)
+
+    def close(self, finished):
+        super().close(finished)
+        if not finished:
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        with open(self.path) as f:
+            rows = [json.loads(line) for line in f]
+        columns = {name: [row.get(name) for row in rows] for name in FIELDS}
+        pq.write_table(pa.table(columns), self.parquet_path)
+        os.remove(self.path)
+
+
+OUTPUTS = {'.csv': CSVOutput, '.jsonl': JSONLOutput, '.parquet': ParquetOutput}
+
+
+def _open_at(path, offset, newline=None):
+    """Open `path` for appending after truncating it to `offset` bytes."""
+    if offset and os.path.exists(path):
+        with open(path, 'r+b') as f:
+            f.truncate(offset)
+        return open(path, 'a', newline=newline, encoding='utf-8')
+    return open(path, 'w', newline=newline, encoding='utf-8')
+
+
+def load_checkpoint(path, config):
+    """Return the checkpoint at `path`, or an empty one if there is none."""
+    if not os.path.exists(path):
+        return {'config': config, 'done': [], 'offset': 0}
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('config') != config:
+        raise ValueError(f'{path} was written with different settings ({checkpoint.get("config")}); '
+                         'rerun without --resume to start over')
+    return checkpoint
+
+
+def save_checkpoint(path, config, done, offset):
+    # Write-then-rename so a crash never leaves a half-written checkpoint
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'config': config, 'done': done, 'offset': offset}, f)
+    os.replace(tmp, path)
+
+
+# ---------------------------------------------------------------------------
+# Driver
+# ---------------------------------------------------------------------------
+
+def run(inputs, output, model_path='emotion_model.h5', detector='haar', detector_options=None, workers=None,
+        chunk_size=256, batch_size=64, frame_step=1, include_empty=False, resume=False):
+    ext = os.path.splitext(output)[1].lower()
+    if ext not in OUTPUTS:
+        raise ValueError(f"Unsupported output format '{ext}'. Use one of: {', '.join(OUTPUTS)}")
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f'Model file not found at {model_path}')
+
+    videos, images = collect_inputs(inputs)
+    units = plan_units(videos, images, chunk_size, frame_step)
+    print(f'{len(videos)} video(s), {len(images)} image(s) -> {len(units)} work unit(s)')
+
+    # Settings that change unit keys or row contents must match to resume
+    config = {'model': os.path.abspath(model_path), 'detector': detector, 'detector_options': detector_options or {},
+              'chunk_size': chunk_size, 'frame_step': frame_step, 'include_empty': include_empty}
+    checkpoint_path = output + '.checkpoint.json'
+    checkpoint = load_checkpoint(checkpoint_path, config) if resume else {'done': [], 'offset': 0}
+    done = list(checkpoint['done'])
+    finished_keys = set(done)
+    todo = [u for u in units if u['key'] not in finished_keys]
+    if finished_keys:
+        print(f'Resuming: {len(units) - len(todo)} unit(s) already done')
+
+    out = OUTPUTS[ext](output, checkpoint['offset'])
+    workers = workers or os.cpu_count() or 1
+    # Split the cores between workers rather than letting each one use all of them
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    ctx = multiprocessing.get_context('spawn')  # TensorFlow is not fork-safe
+    start = time.perf_counter()
+    frames = faces = 0
+    completed = False
+    try:
+        with ctx.Pool(workers, initializer=init_worker,
+                      initargs=(model_path, detector, detector_options or {}, batch_size, include_empty, threads)) as pool:
+            # imap keeps results in unit order, so the checkpoint is always a prefix of the plan
+            for i, (key, rows, unit_frames) in enumerate(pool.imap(process_unit, todo), 1):
+                out.write(rows)
+                done.append(key)
+                save_checkpoint(checkpoint_path, config, done, out.flush())
+                frames += unit_frames
+                faces += sum(1 for r in rows if 'face' in r)
+                elapsed = time.perf_counter() - start
+                print(f'[{i}/{len(todo)}] {key}: {unit_frames} frames, {len(rows)} rows '
+                      f'({frames / elapsed:.1f} frames/s overall)')
+        completed = True
+    finally:
+        out.close(finished=completed)
+    if completed:
+        os.remove(checkpoint_path)
+    elapsed = time.perf_counter() - start
+    print(f'Processed {frames} frames, {faces} faces in {elapsed:.1f}s -> {output}')
+
+
+def main():
+    from face_detectors import BACKENDS, parse_options
+
+    parser = argparse.ArgumentParser(description='Batch emotion detection over videos and image folders')
+    parser.add_argument('inputs', nargs='+', help='Video files, image files or directories')
+    parser.add_argument('--output', '-o', required=True, help='Output file (.csv, .jsonl or .parquet)')
+    parser.add_argument('--model', default='emotion_model.h5', help='Path to a .h5, .tflite or .onnx model')
+    parser.add_argument('--detector', default='haar', choices=sorted(BACKENDS), help='Face detector backend')
+    parser.add_argument('--detector-option', action='append', metavar='KEY=VALUE',
+                        help='Detector parameter, e.g. detect_size=640 (repeatable)')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('--chunk-size', type=int, default=256, help='Frames or images per work unit')
+    parser.add_argument('--batch-size', type=int, default=64, help='Max faces per model call')
+    parser.add_argument('--frame-step', type=int, default=1, help='Process every Nth video frame')
+    parser.add_argument('--include-empty', action='store_true', help='Write a row for frames without faces')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted run from its checkpoint')
+    args = parser.parse_args()
+    run(args.inputs, args.output, model_path=args.model, detector=args.detector,
+        detector_options=parse_options(args.detector_option), workers=args.workers,
+        chunk_size=args.chunk_size, batch_size=args.batch_size, frame_step=max(1, args.frame_step),
+        include_empty=args.include_empty, resume=args.resume)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+"""Micro-benchmarks for the emotion detection hot paths.
+
+Usage:
+    python benchmark.py faces --model emotion_model.h5 --faces 1 5 10 30
+    python benchmark.py detectors --images photos/ --backends haar lbp yunet --annotations boxes.json
+    python benchmark.py preprocess --faces 1 5 10 30
+    python benchmark.py frames --frames 500 --faces 3
+
+`preprocess` compares the old per-face preprocessing (resize, float conversion
+and channel axis for every crop of the grayscale frame) with
+face_preprocessing.FacePreprocessor, and reports time, the peak memory
+allocated per call and whether the outputs match.
+
+`frames` runs the capture -> grayscale -> face tensor steps of the live loop
+with fresh arrays per frame and with the reusable buffers of
+live_emotion_detection (FramePool, GrayRing, FacePreprocessor), and reports
+per-frame latency, its jitter and the memory allocated per frame. Frames come
+from `--video` or from a synthetic capture that fills buffers in place the way
+`cv2.VideoCapture.read(image)` does.
+
+`detectors` compares face-detector backends on a local image folder. Recall and
+precision are reported when `--annotations` points to a JSON file mapping image
+file names to lists of ground-truth [x, y, w, h] boxes.
+
+If `--model` is not found, an untrained model from `train_emotion_model.build_model`
+is used so latency can still be measured without a trained checkpoint.
+"""
+import argparse
+import json
+import os
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from face_tracking import box_iou
+
+
+def load_model(model_path):
+    if model_path and os.path.exists(model_path):
+        from inference_backends import load_model as load_backend
+        print('Loading model:', model_path)
+        return load_backend(model_path, warmup=True)
+    print('Model not found; using an untrained model from build_model()')
+    from train_emotion_model import build_model
+    return build_model(input_shape=(48, 48, 1), num_classes=7)
+
+
+def time_call(fn, repeats):
+    """Return the median wall time of `fn()` in milliseconds."""
+    fn()  # warm-up
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000.0)
+    return float(np.median(times))
+
+
+def bench_faces(args):
+    """Compare per-face predict calls with one batched predict call."""
+    model = load_model(args.model)
+    rng = np.random.default_rng(0)
+
+    print(f"{'faces':>6} {'per-face ms':>12} {'batched ms':>11} {'speedup':>8}")
+    for n in args.faces:
+        faces = rng.random((n, 48, 48, 1), dtype=np.float32)
+
+        def per_face():
+            for i in range(n):
+                model.predict(faces[i:i+1], verbose=0)
+
+        def batched():
+            model.predict(faces, verbose=0)
+
+        loop_ms = time_call(per_face, args.repeats)
+        batch_ms = time_call(batched, args.repeats)
+        print(f'{n:>6} {loop_ms:>12.2f} {batch_ms:>11.2f} {loop_ms / batch_ms:>7.1f}x')
+
+
+def peak_alloc_kb(fn):
+    """Return the peak memory allocated while running `fn()`, in KiB."""
+    fn()  # warm-up, so buffers that persist across calls are not counted
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1024.0
+    finally:
+        tracemalloc.stop()
+
+
+def bench_preprocess(args):
+    """Compare per-face preprocessing with the shared preallocated-buffer path."""
+    from face_preprocessing import FacePreprocessor
+
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8)
+    # Both paths start from the grayscale frame that face detection already needs
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    preprocessor = FacePreprocessor()
+
+    def per_face(boxes):
+        # The previous approach: a resized copy, a float copy and a reshaped copy per crop
+        batch = np.empty((len(boxes), 48, 48, 1), dtype='float32')
+        for i, (x, y, w, h) in enumerate(boxes):
+            batch[i] = np.expand_dims(cv2.resize(gray[y:y+h, x:x+w], (48, 48)).astype('float32') / 255.0, -1)
+        return batch
+
+    print(f'frame {args.width}x{args.height}')
+    print(f"{'faces':>6} {'per-face ms':>12} {'shared ms':>10} {'per-face KiB':>13} {'shared KiB':>11} {'identical':>10}")
+    for n in args.faces:
+        sizes = rng.integers(60, 200, n)
+        boxes = [(int(rng.integers(0, args.width - s)), int(rng.integers(0, args.height - s)), int(s), int(s))
+                 for s in sizes]
+        identical = np.array_equal(per_face(boxes), preprocessor(gray, boxes))
+        loop_ms = time_call(lambda: per_face(boxes), args.repeats)
+        shared_ms = time_call(lambda: preprocessor(gray, boxes), args.repeats)
+        loop_kb = peak_alloc_kb(lambda: per_face(boxes))
+        shared_kb = peak_alloc_kb(lambda: preprocessor(gray, boxes))
+        print(f'{n:>6} {loop_ms:>12.3f} {shared_ms:>10.3f} {loop_kb:>13.1f} {shared_kb:>11.1f} {str(identical):>10}')
+
+
+class SyntheticCapture:
+    """Stand-in for cv2.VideoCapture returning a fixed random frame."""
+
+    def __init__(self, width, height):
+        self.frame = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+    def read(self, image=None):
+        if image is None or image.shape != self.frame.shape:
+            return True, self.frame.copy()
+        np.copyto(image, self.frame)
+        return True, image
+
+
+def bench_frames(args):
+    """Compare per-frame allocation churn of the plain and buffered live loops."""
+    from face_preprocessing import FacePreprocessor
+    from live_emotion_detection import FramePool, GrayRing
+
+    def open_capture():
+        return cv2.VideoCapture(args.video) if args.video else SyntheticCapture(args.width, args.height)
+
+    size = 96
+    boxes = [(40 + i * (size + 20), 40, size, size) for i in range(args.faces)]
+
+    def plain_loop():
+        cap = open_capture()
+
+        def step():
+            ret, frame = cap.read()
+            if not ret:
+                return False
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            batch = np.empty((len(boxes), 48, 48, 1), dtype='float32')
+            for i, (x, y, w, h) in enumerate(boxes):
+                batch[i] = np.expand_dims(cv2.resize(gray[y:y+h, x:x+w], (48, 48)).astype('float32') / 255.0, -1)
+            return True
+        return step
+
+    def buffered_loop():
+        cap = open_capture()
+        frames, grays, preprocessor = FramePool(1), GrayRing(2), FacePreprocessor()
+
+        def step():
+            ret, buf = frames.read(cap)
+            if not ret:
+                return False
+            preprocessor(grays.convert(buf.image), boxes)
+            frames.release(buf)
+            return True
+        return step
+
+    def measure(make_step):
+        step = make_step()
+        for _ in range(10):  # warm-up: fill buffers
+            step()
+        times = []
+        for _ in range(args.frames):
+            start = time.perf_counter()
+            if not step():
+                break
+            times.append((time.perf_counter() - start) * 1000.0)
+        step = make_step()
+        for _ in range(10):
+            step()
+        allocs = []
+        tracemalloc.start()
+        try:
+            for _ in range(min(args.frames, 100)):
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+                if not step():
+                    break
+                allocs.append((tracemalloc.get_traced_memory()[1] - base) / 1024.0)
+        finally:
+            tracemalloc.stop()
+        return np.array(times), np.array(allocs)
+
+    source = args.video or f'synthetic {args.width}x{args.height}'
+    print(f'{source}, {args.faces} face(s) per frame, {args.frames} frames')
+    print(f"{'loop':>9} {'mean ms':>8} {'p99 ms':>7} {'std ms':>7} {'KiB/frame':>10}")
+    for name, make_step in (('plain', plain_loop), ('buffered', buffered_loop)):
+        times, allocs = measure(make_step)
+        if not len(times):
+            print(f'{name:>9} no frames read')
+            continue
+        print(f'{name:>9} {times.mean():>8.3f} {np.percentile(times, 99):>7.3f} {times.std():>7.3f} '
+              f'{np.median(allocs):>10.1f}')
+
+
+def count_matches(pred, truth, threshold=0.5):
+    """Greedily match predicted to ground-truth boxes; return the number of true positives."""
+    unmatched = list(truth)
+    matched = 0
+    for p in pred:
+        scores = [box_iou(p, t) for t in unmatched]
+        if scores and max(scores) >= threshold:
+            unmatched.pop(int(np.argmax(scores)))
+            matched += 1
+    return matched
+
+
+def load_images(folder):
+    exts = ('.jpg', '.jpeg', '.png', '.bmp')
+    names = sorted(n for n in os.listdir(folder) if n.lower().endswith(exts))
+    images = []
+    for name in names:
+        img = cv2.imread(os.path.join(folder, name), cv2.IMREAD_COLOR)
+        if img is not None:
+            images.append((name, img))
+    return images
+
+
+def bench_detectors(args):
+    """Compare detection latency (and recall, if annotated) across backends."""
+    from face_detectors import create_detector, parse_options
+
+    images = load_images(args.images)
+    if not images:
+        print('No images found in', args.images)
+        return
+    truth = None
+    if args.annotations:
+        with open(args.annotations) as f:
+            truth = json.load(f)
+
+    options = parse_options(args.option)
+    print(f'{len(images)} images from {args.images}')
+    print(f"{'backend':>8} {'median ms':>10} {'mean ms':>8} {'faces':>6} {'recall':>7} {'precision':>9}")
+    for backend in args.backends:
+        backend_options = {k.split('.', 1)[1]: v for k, v in options.items() if k.startswith(backend + '.')}
+        try:
+            detector = create_detector(backend, **backend_options)
+        except (FileNotFoundError, ValueError) as e:
+            print(f'{backend:>8} skipped: {e}')
+            continue
+
+        times, found, tp, total_truth = [], 0, 0, 0
+        for name, img in images:
+            detector.detect(img)  # warm-up / input-size setup
+            start = time.perf_counter()
+            boxes = detector.detect(img)
+            times.append((time.perf_counter() - start) * 1000.0)
+            found += len(boxes)
+            if truth is not None and name in truth:
+                tp += count_matches(boxes, truth[name], args.iou)
+                total_truth += len(truth[name])
+
+        recall = f'{tp / total_truth:.3f}' if total_truth else '-'
+        precision = f'{tp / found:.3f}' if total_truth and found else '-'
+        print(f'{backend:>8} {np.median(times):>10.2f} {np.mean(times):>8.2f} {found:>6} {recall:>7} {precision:>9}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('faces', help='Latency vs. number of faces per image')
+    p.add_argument('--model', type=str, default='emotion_model.h5', help='Path to trained model (.h5, .tflite or .onnx)')
+    p.add_argument('--faces', type=int, nargs='+', default=[1, 2, 5, 10, 20, 30], help='Face counts to benchmark')
+    p.add_argument('--repeats', type=int, default=20, help='Timed repetitions per measurement')
+    p.set_defaults(func=bench_faces)
+
+    p = sub.add_parser('preprocess', help='Per-face vs. shared buffer preprocessing time and allocations')
+    p.add_argument('--faces', type=int, nargs='+', default=[1, 5, 10, 30], help='Face counts to benchmark')
+    p.add_argument('--width', type=int, default=1280, help='Frame width')
+    p.add_argument('--height', type=int, default=720, help='Frame height')
+    p.add_argument('--repeats', type=int, default=200, help='Timed repetitions per measurement')
+    p.set_defaults(func=bench_preprocess)
+
+    p = sub.add_parser('frames', help='Per-frame allocations and latency jitter of the live capture loop')
+    p.add_argument('--video', type=str, default=None, help='Read frames from this video instead of a synthetic capture')
+    p.add_argument('--frames', type=int, default=500, help='Frames to process per loop')
+    p.add_argument('--faces', type=int, default=3, help='Face boxes per frame')
+    p.add_argument('--width', type=int, default=1280, help='Synthetic frame width')
+    p.add_argument('--height', type=int, default=720, help='Synthetic frame height')
+    p.set_defaults(func=bench_frames)
+
+    p = sub.add_parser('detectors', help='Face detector latency and recall per backend')
+    p.add_argument('--images', type=str, required=True, help='Folder of test images')
+    p.add_argument('--backends', type=str, nargs='+', default=['haar', 'lbp', 'ssd', 'yunet'], help='Backends to compare')
+    p.add_argument('--annotations', type=str, default=None, help='JSON file mapping image names to [x, y, w, h] boxes')
+    p.add_argument('--iou', type=float, default=0.5, help='IoU threshold for a detection to count as a match')
+    p.add_argument('--option', action='append', default=[], metavar='BACKEND.KEY=VALUE',
+                   help='Backend parameter, e.g. haar.min_neighbors=4 or yunet.model_path=...; repeatable')
+    p.set_defaults(func=bench_detectors)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
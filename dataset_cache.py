@@ -0,0 +1,191 @@
+"""Compiled, memory-mapped copies of the training data for repeat training runs.
+
+`train_emotion_model.py --compile_dataset` decodes the images once and writes
+each split as uint8 shards plus an index:
+
+    cache/compiled/train.index.json        class names, shard list, source fingerprint
+    cache/compiled/train.00000.images.npy  uint8 (n, 48, 48)
+    cache/compiled/train.00000.labels.npy  uint8 (n,)
+
+Later runs open the shards with `np.load(mmap_mode='r')` and feed tf.data
+from them (`to_dataset`), so no image is decoded again and the arrays are
+paged in from the OS cache instead of being copied into memory up front.
+
+For a folder split, the index stores a fingerprint of the source directory
+(relative paths, sizes and mtimes of its images). `load_compiled` returns
+None when the fingerprint no longer matches, so adding, removing or touching
+an image makes the cache stale.
+"""
+import hashlib
+import json
+import os
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.bmp', '.gif', '.jpeg', '.jpg', '.png')
+SHARD_SIZE = 65536
+
+
+def list_images(src_dir):
+    """Return (class_names, [(path, label)]) for a `<src_dir>/<class_name>/*` layout.
+
+    Classes are sorted alphanumerically like `image_dataset_from_directory`.
+    """
+    class_names = sorted(d for d in os.listdir(src_dir) if os.path.isdir(os.path.join(src_dir, d)))
+    files = []
+    for label, name in enumerate(class_names):
+        class_dir = os.path.join(src_dir, name)
+        for root, _, names in os.walk(class_dir):
+            for n in sorted(names):
+                if n.lower().endswith(IMAGE_EXTENSIONS):
+                    files.append((os.path.join(root, n), label))
+    files.sort()
+    return class_names, files
+
+
+def directory_fingerprint(src_dir, files, image_size):
+    """Hash of the relative paths, sizes and mtimes of `files` (and the target size)."""
+    h = hashlib.sha1(repr(tuple(image_size)).encode())
+    for path, label in files:
+        st = os.stat(path)
+        h.update(f'{os.path.relpath(path, src_dir)}\0{label}\0{st.st_size}\0{st.st_mtime_ns}\n'.encode())
+    return h.hexdigest()
+
+
+def _index_path(cache_dir, name):
+    return os.path.join(cache_dir, f'{name}.index.json')
+
+
+def write_compiled(images, labels, cache_dir, name, class_names, fingerprint, source, shard_size=SHARD_SIZE):
+    """Write uint8 (n, h, w) `images` and integer `labels` as shards plus an index."""
+    os.makedirs(cache_dir, exist_ok=True)
+    shards = []
+    for i, start in enumerate(range(0, max(len(images), 1), shard_size)):
+        stop = min(start + shard_size, len(images))
+        stem = f'{name}.{i:05d}'
+        out = np.lib.format.open_memmap(os.path.join(cache_dir, stem + '.images.npy'), mode='w+',
+                                        dtype=np.uint8, shape=(stop - start,) + tuple(images.shape[1:3]))
+        out[:] = images[start:stop].reshape(out.shape)
+        out.flush()
+        del out
+        np.save(os.path.join(cache_dir, stem + '.labels.npy'), np.asarray(labels[start:stop], dtype=np.uint8))
+        shards.append({'stem': stem, 'count': stop - start})
+    index = {
+        'source': source,
+        'fingerprint': fingerprint,
+        'class_names': list(class_names),
+        'image_shape': list(images.shape[1:3]),
+        'count': int(len(images)),
+        'shards': shards,
+    }
+    # The index is written last, so a crash mid-compile leaves no usable cache behind
+    tmp = _index_path(cache_dir, name) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp, _index_path(cache_dir, name))
+    return index
+
+
+def compile_directory(src_dir, cache_dir, name, image_size=(48, 48), batch_size=256):
+    """Decode every image under `src_dir` once and write it as a compiled split.
+
+    Decoding and resizing go through the same TensorFlow ops as
+    `image_dataset_from_directory(color_mode='grayscale')`, in parallel, but
+    the result is stored rounded to uint8. For images already at `image_size`
+    (such as FER-2013's 48x48 crops) resizing is the identity and the pixels
+    match exactly; images that need resizing lose the fractional part of the
+    interpolated values.
+    """
+    import tensorflow as tf
+
+    class_names, files = list_images(src_dir)
+    fingerprint = directory_fingerprint(src_dir, files, image_size)
+
+    def decode(path):
+        image = tf.io.decode_image(tf.io.read_file(path), channels=1, expand_animations=False)
+        image = tf.image.resize(image, image_size, method='bilinear')
+        return tf.cast(tf.clip_by_value(tf.round(image), 0, 255), tf.uint8)[..., 0]
+
+    paths = tf.data.Dataset.from_tensor_slices([p for p, _ in files])
+    ds = paths.map(decode, num_parallel_calls=tf.data.AUTOTUNE).batch(batch_size).prefetch(tf.data.AUTOTUNE)
+    images = np.empty((len(files),) + tuple(image_size), dtype=np.uint8)
+    offset = 0
+    for batch in ds:
+        images[offset:offset + len(batch)] = batch.numpy()
+        offset += len(batch)
+    labels = np.array([label for _, label in files], dtype=np.uint8)
+    return write_compiled(images, labels, cache_dir, name, class_names, fingerprint, os.path.abspath(src_dir))
+
+
+class CompiledSplit:
+    """A compiled split opened as memory-mapped shards."""
+
+    def __init__(self, cache_dir, index):
+        self.index = index
+        self.class_names = index['class_names']
+        self.images = [np.load(os.path.join(cache_dir, s['stem'] + '.images.npy'), mmap_mode='r')
+                       for s in index['shards']]
+        # Labels are tiny, so they are read into memory
+        self.labels = np.concatenate([np.load(os.path.join(cache_dir, s['stem'] + '.labels.npy'))
+                                      for s in index['shards']])
+        self._offsets = np.cumsum([0] + [len(a) for a in self.images])
+
+    def __len__(self):
+        return len(self.labels)
+
+    def gather(self, indices):
+        """Return (uint8 images, labels) for an array of example indices."""
+        indices = np.asarray(indices)
+        out = np.empty((len(indices),) + self.images[0].shape[1:], dtype=np.uint8)
+        shard = np.searchsorted(self._offsets, indices, side='right') - 1
+        for s in np.unique(shard):
+            mask = shard == s
+            out[mask] = self.images[s][indices[mask] - self._offsets[s]]
+        return out, self.labels[indices]
+
+    def to_dataset(self, batch_size=64, shuffle=False, shuffle_buffer=None):
+        """Batched tf.data pipeline of float32 (n, h, w, 1) images in [0,1] and one-hot labels.
+
+        Batches of indices are shuffled and gathered from the memory-mapped
+        shards, so the whole split is never copied into memory at once.
+        """
+        import tensorflow as tf
+
+        num_classes = len(self.class_names)
+        h, w = self.images[0].shape[1:3]
+
+        def gather(indices):
+            # Sorted indices read the memmap front to back
+            images, labels = self.gather(np.sort(indices))
+            return images, labels
+
+        def load(indices):
+            images, labels = tf.numpy_function(gather, [indices], (tf.uint8, tf.uint8))
+            # numpy_function outputs have unknown shape; Keras metrics need the rank
+            images.set_shape([None, h, w])
+            labels.set_shape([None])
+            images = tf.reshape(images, (-1, h, w, 1))
+            # float32 division by 255 like face_preprocessing.normalize
+            return tf.cast(images, tf.float32) / 255.0, tf.one_hot(tf.cast(labels, tf.int32), num_classes)
+
+        ds = tf.data.Dataset.range(len(self))
+        if shuffle:
+            ds = ds.shuffle(shuffle_buffer or len(self), reshuffle_each_iteration=True)
+        return ds.batch(batch_size).map(load, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+
+def load_compiled(cache_dir, name, fingerprint=None):
+    """Open a compiled split, or return None if it is missing or its fingerprint doesn't match."""
+    path = _index_path(cache_dir, name)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        index = json.load(f)
+    if fingerprint is not None and index.get('fingerprint') != fingerprint:
+        return None
+    return CompiledSplit(cache_dir, index)
+
+
+def load_compiled_directory(src_dir, cache_dir, name, image_size=(48, 48)):
+    """Open the compiled copy of `src_dir`, or return None if there is none or it is stale."""
+    _, files = list_images(src_dir)
+    return load_compiled(cache_dir, name, directory_fingerprint(src_dir, files, image_size))
@@ -1,6 +1,35 @@
+import os
+import sys
+
 from django.apps import AppConfig
 
 
+def _is_runserver():
+    """True in the process that serves `manage.py runserver` requests.
+
+    With the autoreloader on, the parent process only watches files; the
+    child it spawns (RUN_MAIN=true) is the one that handles requests.
+    """
+    if sys.argv[1:2] != ['runserver']:
+        return False
+    return '--noreload' in sys.argv or os.environ.get('RUN_MAIN') == 'true'
+
+
 class EmotionAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'emotion_app'
+
+    def ready(self):
+        from django.conf import settings
+        import metrics
+
+        if getattr(settings, 'EMOTION_METRICS_ENABLED', False):
+            metrics.enable()
+
+        # Load the face detector at startup so the first request doesn't pay
+        # for it. Only when serving: migrate, collectstatic, test and other
+        # management commands must not need the detector files. ASGI/WSGI
+        # servers preload from asgi.py/wsgi.py instead.
+        if _is_runserver():
+            from .detectors import preload_face_detectors
+            preload_face_detectors()
@@ -0,0 +1,134 @@
+"""Cross-request micro-batching for emotion model inference.
+
+Concurrent requests submit their preprocessed face tensors to a shared
+InferenceScheduler. A single worker thread gathers queued tensors until either
+the batch is full or the oldest request has waited `max_wait_ms`, runs one
+`model.predict` call, and hands each caller back its slice of the output.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class InferenceScheduler:
+    """Gather face tensors from concurrent callers into shared predict calls."""
+
+    def __init__(self, model, max_batch_size=32, max_wait_ms=5.0):
+        self.model = model
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = float(max_wait_ms)
+
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._requests = 0
+        self._rows = 0
+        self._max_queue_depth = 0
+        self._batch_sizes = {}
+
+        self._thread = threading.Thread(target=self._run, name='emotion-inference', daemon=True)
+        self._thread.start()
+
+    def predict(self, batch, timeout=None):
+        """Queue a (N, 48, 48, 1) batch and block until its predictions are ready.
+
+        Args:
+            batch: float32 array of preprocessed faces
+            timeout: optional number of seconds to wait for the result
+
+        Returns:
+            Array of shape (N, num_classes) with the model outputs for `batch`
+        """
+        future = Future()
+        self._queue.put((batch, future, time.monotonic()))
+        with self._stats_lock:
+            self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        return future.result(timeout)
+
+    @staticmethod
+    def empty_stats(max_batch_size=32, max_wait_ms=5.0):
+        """Stats in the same shape as stats(), for a scheduler that hasn't started."""
+        return {
+            'queue_depth': 0,
+            'max_queue_depth': 0,
+            'max_batch_size': max_batch_size,
+            'max_wait_ms': max_wait_ms,
+            'batches': 0,
+            'requests': 0,
+            'faces': 0,
+            'mean_batch_size': 0.0,
+            'mean_batch_fill': 0.0,
+            'batch_size_histogram': {},
+        }
+
+    def stats(self):
+        """Return a snapshot of queue depth and batch fill metrics."""
+        with self._stats_lock:
+            batches = self._batches
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self._max_queue_depth,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait_ms,
+                'batches': batches,
+                'requests': self._requests,
+                'faces': self._rows,
+                'mean_batch_size': self._rows / batches if batches else 0.0,
+                'mean_batch_fill': self._rows / (batches * self.max_batch_size) if batches else 0.0,
+                'batch_size_histogram': dict(sorted(self._batch_sizes.items())),
+            }
+
+    def _run(self):
+        carry = None
+        while True:
+            first = carry if carry is not None else self._queue.get()
+            carry = None
+            items = [first]
+            rows = len(first[0])
+            # Measured from when the oldest request was queued, so time spent
+            # waiting behind the previous batch counts towards max_wait_ms
+            deadline = first[2] + self.max_wait_ms / 1000.0
+
+            while rows < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if rows + len(item[0]) > self.max_batch_size:
+                    # Doesn't fit; it starts the next batch instead
+                    carry = item
+                    break
+                items.append(item)
+                rows += len(item[0])
+
+            self._dispatch(items, rows)
+
+    def _dispatch(self, items, rows):
+        if len(items) == 1:
+            batch = items[0][0]
+        else:
+            batch = np.concatenate([item[0] for item in items], axis=0)
+
+        try:
+            predictions = self.model.predict(batch, verbose=0)
+        except Exception as e:
+            for _, future, _ in items:
+                future.set_exception(e)
+            return
+
+        offset = 0
+        for b, future, _ in items:
+            future.set_result(predictions[offset:offset + len(b)])
+            offset += len(b)
+
+        with self._stats_lock:
+            self._batches += 1
+            self._requests += len(items)
+            self._rows += rows
+            self._batch_sizes[rows] = self._batch_sizes.get(rows, 0) + 1
@@ -0,0 +1,108 @@
+"""Process-wide registry of face detectors.
+
+OpenCV detectors (`cv2.CascadeClassifier`, DNN nets) are not safe to share
+between threads, so each detector is kept in a small pool: a request checks an
+instance out, uses it exclusively and returns it. Instances are created once
+and reused for the lifetime of the process, so model files are parsed at most
+once per concurrent worker thread instead of once per request.
+
+The backend and its tuning parameters come from settings.EMOTION_FACE_DETECTOR
+(see face_detectors.py in the repository root for the available backends).
+"""
+import queue
+import threading
+from contextlib import contextmanager
+from functools import partial
+
+from django.conf import settings
+from face_detectors import create_detector
+
+
+class DetectorPool:
+    """Pool of detector instances built by `factory`, one per concurrent user."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.created = 0
+
+    def _create(self):
+        detector = self._factory()
+        with self._lock:
+            self.created += 1
+        return detector
+
+    @contextmanager
+    def acquire(self):
+        """Check out a detector for exclusive use by the calling thread."""
+        try:
+            detector = self._idle.get_nowait()
+        except queue.Empty:
+            detector = self._create()
+        try:
+            yield detector
+        finally:
+            self._idle.put(detector)
+
+    def preload(self, count=1):
+        """Make sure at least `count` idle instances are ready."""
+        while self._idle.qsize() < count:
+            self._idle.put(self._create())
+
+
+_factories = {}
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def register_detector(name, factory):
+    """Register a zero-argument `factory` that builds a detector called `name`."""
+    with _pools_lock:
+        _factories[name] = factory
+        _pools.pop(name, None)
+
+
+def get_detector_pool(name):
+    """Return the shared pool for the detector registered as `name`."""
+    pool = _pools.get(name)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(name)
+            if pool is None:
+                if name not in _factories:
+                    raise KeyError(f"Unknown face detector '{name}'")
+                pool = _pools[name] = DetectorPool(_factories[name])
+    return pool
+
+
+def preload_detector(name, count=1):
+    """Load `count` instances of detector `name` ahead of the first request."""
+    get_detector_pool(name).preload(count)
+
+
+def preload_face_detectors():
+    """Load settings.EMOTION_PRELOAD_DETECTORS face detectors ahead of the first request."""
+    count = getattr(settings, 'EMOTION_PRELOAD_DETECTORS', 1)
+    if count:
+        get_face_detector_pool().preload(count)
+
+
+def get_face_detector_config():
+    """Return (backend, options) from settings.EMOTION_FACE_DETECTOR."""
+    config = getattr(settings, 'EMOTION_FACE_DETECTOR', {})
+    return config.get('BACKEND', 'haar'), config.get('OPTIONS', {})
+
+
+def load_configured_detector():
+    """Create a new instance of the face detector configured in settings."""
+    backend, options = get_face_detector_config()
+    return create_detector(backend, **options)
+
+
+def get_face_detector_pool():
+    """Return the shared pool of the configured face detector."""
+    backend, options = get_face_detector_config()
+    if backend not in _factories:
+        register_detector(backend, partial(create_detector, backend, **options))
+    return get_detector_pool(backend)
@@ -1,63 +1,134 @@
 """Utility functions for emotion detection in Django app."""
 import cv2
 import numpy as np
-import tensorflow as tf
 from django.conf import settings
 import os
+import threading
+import time
+from .batching import InferenceScheduler
+from .detectors import get_face_detector_pool, load_configured_detector
+from .result_cache import get_result_cache
+from inference_backends import load_model
+from face_preprocessing import FacePreprocessor, preprocess_face, to_gray
+import metrics
 
 EMOTION_LABELS = ['Angry', 'Disgust', 'Fear', 'Happy', 'Sad', 'Surprise', 'Neutral']
 
 # Global model variable
 _model = None
 
+# Global micro-batching scheduler (created on first use)
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
 
 def get_model():
-    """Load and cache the emotion detection model."""
+    """Load and cache the emotion detection model.
+    
+    The inference backend (Keras, TFLite or ONNX Runtime) is taken from
+    settings.EMOTION_MODEL_BACKEND, or inferred from the model file extension.
+    """
     global _model
     if _model is None:
         model_path = settings.EMOTION_MODEL_PATH
         if not os.path.exists(model_path):
             raise FileNotFoundError(f"Model file not found at {model_path}")
-        _model = tf.keras.models.load_model(model_path)
+        start = time.perf_counter()
+        _model = load_model(model_path, getattr(settings, 'EMOTION_MODEL_BACKEND', None), warmup=True)
+        metrics.MODEL_LOAD_SECONDS.set(time.perf_counter() - start)
         print(f"Loaded emotion model from {model_path}")
     return _model
 
 
+def get_scheduler():
+    """Return the shared inference scheduler, or None if batching is disabled."""
+    global _scheduler
+    if not getattr(settings, 'EMOTION_BATCH_ENABLED', True):
+        return None
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = InferenceScheduler(
+                    get_model(),
+                    max_batch_size=getattr(settings, 'EMOTION_BATCH_MAX_SIZE', 32),
+                    max_wait_ms=getattr(settings, 'EMOTION_BATCH_MAX_WAIT_MS', 5.0),
+                )
+    return _scheduler
+
+
+def peek_scheduler():
+    """Return the inference scheduler if it has been started, without starting it."""
+    return _scheduler
+
+
+def predict_batch(batch):
+    """Run the model on a preprocessed (N, 48, 48, 1) batch.
+    
+    Goes through the shared micro-batching scheduler when enabled so that
+    faces from concurrent requests share a single predict call.
+    """
+    scheduler = get_scheduler()
+    if scheduler is None:
+        return get_model().predict(batch, verbose=0)
+    return scheduler.predict(batch)
+
+
 def preprocess_image(image):
     """Ensure image is float32 normalized to [0,1] and resized to (48,48).
     
     Args:
-        image: numpy array (grayscale or RGB)
+        image: numpy array (grayscale, BGR or BGRA)
         
     Returns:
         Preprocessed image array with shape (48, 48, 1)
     """
-    # Convert to grayscale if needed
-    if len(image.shape) == 3:
-        if image.shape[2] == 3:
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        elif image.shape[2] == 4:
-            image = cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
-    
-    # Resize to 48x48
-    image = cv2.resize(image, (48, 48))
-    
-    # Normalize
-    image = image.astype('float32') / 255.0
+    return preprocess_face(image)
+
+
+_local = threading.local()
+
+
+def preprocess_faces(image, boxes):
+    """Crop and preprocess every face box into a single contiguous batch.
     
-    # Add channel dimension
-    image = np.expand_dims(image, -1)
+    The batch lives in a per-thread buffer that is reused by the next call
+    from the same thread, so it must be consumed before then.
     
-    return image
+    Args:
+        image: numpy array of the full image (grayscale, BGR or BGRA)
+        boxes: iterable of (x, y, w, h) face boxes
+        
+    Returns:
+        float32 array with shape (N, 48, 48, 1), in the same order as boxes
+    """
+    return _get_preprocessor()(image, boxes)
+
+
+def _get_preprocessor():
+    preprocessor = getattr(_local, 'preprocessor', None)
+    if preprocessor is None:
+        preprocessor = _local.preprocessor = FacePreprocessor()
+    return preprocessor
 
 
 def load_face_detector():
-    """Load Haar Cascade face detector."""
-    cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-    if not os.path.exists(cascade_path):
-        raise FileNotFoundError('Haar cascade XML not found in OpenCV data')
-    face_cascade = cv2.CascadeClassifier(cascade_path)
-    return face_cascade
+    """Load a new instance of the face detector configured in settings.
+    
+    Request handling should use the shared pool from get_face_detector_pool()
+    instead, which avoids re-loading the detector on every call.
+    """
+    return load_configured_detector()
+
+
+def detect_faces(image_array):
+    """Return (gray, faces): the grayscale image and its (x, y, w, h) face boxes."""
+    # Convert to grayscale once; it serves the cascade detectors and the
+    # face crops (the DNN backends get the color image)
+    gray = to_gray(image_array)
+    with metrics.timed('detect'), get_face_detector_pool().acquire() as face_detector:
+        faces = face_detector.detect(image_array if face_detector.needs_color else gray)
+    metrics.FACES_PER_IMAGE.observe(len(faces))
+    return gray, faces
 
 
 def detect_emotion_in_image(image_array):
@@ -69,38 +140,64 @@ def detect_emotion_in_image(image_array):
     Returns:
         List of dictionaries containing face locations and emotion predictions
     """
-    model = get_model()
-    face_cascade = load_face_detector()
+    gray, faces = detect_faces(image_array)
+    if len(faces) == 0:
+        return []
     
-    # Convert to grayscale for face detection
-    if len(image_array.shape) == 3:
-        gray = cv2.cvtColor(image_array, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = image_array
+    # Preprocess every face into one (N, 48, 48, 1) batch and classify it
+    # with a single forward pass instead of one predict call per face
+    with metrics.timed('preprocess'):
+        batch = preprocess_faces(gray, faces)
+    with metrics.timed('predict'):
+        predictions = predict_batch(batch)
+    return format_results(faces, predictions)
+
+
+def detect_emotion_smoothed(image_array, smoother, track_ids):
+    """Detect emotions in one frame of a stream, smoothed per tracked face.
+    
+    Args:
+        image_array: numpy array of the frame
+        smoother: emotion_smoothing.EmotionSmoother holding the stream's state
+        track_ids: callable mapping the frame's face boxes to stable track IDs
+        
+    Returns:
+        Result dictionaries like detect_emotion_in_image. Only faces whose
+        crop changed noticeably (or that are due for re-classification) go
+        through the model; the others reuse their track's moving average.
+    """
+    gray, faces = detect_faces(image_array)
+    ids = track_ids(faces)
+    if len(faces) == 0:
+        smoother.advance()
+        return []
     
-    # Detect faces
-    faces = face_cascade.detectMultiScale(gray, scaleFactor=1.3, minNeighbors=5)
+    preprocessor = _get_preprocessor()
+    with metrics.timed('preprocess'):
+        crops = preprocessor.crop(gray, faces)
     
+    def predict(indices):
+        with metrics.timed('preprocess'):
+            batch = preprocessor.normalize(crops[indices])
+        with metrics.timed('predict'):
+            return predict_batch(batch)
+    
+    return format_results(faces, smoother.classify(ids, crops, predict))
+
+
+def format_results(faces, predictions):
+    """Build the result dictionaries for face boxes and their class probabilities."""
     results = []
-    for (x, y, w, h) in faces:
-        # Extract face region
-        face_img = image_array[y:y+h, x:x+w]
-        
-        # Preprocess
-        processed = preprocess_image(face_img)
-        processed = np.expand_dims(processed, 0)  # Add batch dimension
-        
-        # Predict
-        predictions = model.predict(processed, verbose=0)
-        emotion_idx = int(np.argmax(predictions))
-        confidence = float(np.max(predictions))
+    for (x, y, w, h), probs in zip(faces, predictions):
+        emotion_idx = int(np.argmax(probs))
+        confidence = float(probs[emotion_idx])
         
         results.append({
             'box': {'x': int(x), 'y': int(y), 'width': int(w), 'height': int(h)},
             'emotion': EMOTION_LABELS[emotion_idx],
             'confidence': confidence,
             'all_predictions': {
-                label: float(predictions[0][i]) 
+                label: float(probs[i]) 
                 for i, label in enumerate(EMOTION_LABELS)
             }
         })
@@ -108,6 +205,48 @@ def detect_emotion_in_image(image_array):
     return results
 
 
+def decode_image(data):
+    """Decode encoded image bytes into a BGR image, raising ValueError if invalid."""
+    with metrics.timed('decode'):
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError('Invalid image data')
+    return image
+
+
+def detect_emotion_in_bytes(data, need_image=False):
+    """Decode an encoded image (JPEG, PNG, ...) and detect emotions in it.
+    
+    Results are looked up in the result cache first, keyed by a hash of
+    `data`; on a hit the image is only decoded if `need_image` is True.
+    
+    Args:
+        data: encoded image bytes (bytes, bytearray or memoryview)
+        need_image: decode the image even if the results are cached
+        
+    Returns:
+        (image, results): the decoded BGR image (None if it wasn't needed)
+        and the list of result dictionaries from detect_emotion_in_image
+        
+    Raises:
+        ValueError: if the data can't be decoded as an image
+    """
+    cache = get_result_cache()
+    key = cache.key_for(data) if cache is not None else None
+    results = cache.get(key) if cache is not None else None
+    
+    image = None
+    if results is None or need_image:
+        image = decode_image(data)
+    
+    if results is None:
+        results = detect_emotion_in_image(image)
+        if cache is not None:
+            cache.set(key, results)
+    
+    return image, results
+
+
 def predict_single_emotion(image_array):
     """Predict emotion for a single preprocessed face image.
     
@@ -117,14 +256,12 @@ def predict_single_emotion(image_array):
     Returns:
         Dictionary with emotion and confidence
     """
-    model = get_model()
-    
     # Preprocess
     processed = preprocess_image(image_array)
     processed = np.expand_dims(processed, 0)
     
     # Predict
-    predictions = model.predict(processed, verbose=0)
+    predictions = predict_batch(processed)
     emotion_idx = int(np.argmax(predictions))
     confidence = float(np.max(predictions))
     
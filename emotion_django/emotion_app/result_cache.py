@@ -0,0 +1,163 @@
+"""Result cache for repeated images, keyed by a hash of the uploaded bytes.
+
+Clients often send the same image again (retries, thumbnails, frames from an
+idle camera). Detection results are cached under a BLAKE2b digest of the
+encoded image bytes, prefixed by the model and face-detector configuration so
+that changing either invalidates old entries.
+
+Backends (settings.EMOTION_RESULT_CACHE['BACKEND']):
+    'local'   in-process LRU bounded by entry count, total bytes and TTL
+    'django'  Django's cache framework (settings.CACHES alias, e.g. locmem,
+              file-based or memcached), with the same TTL
+    None      caching disabled
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class BaseResultCache:
+    def __init__(self, ttl=300, max_entry_bytes=256 * 1024):
+        self.ttl = ttl
+        self.max_entry_bytes = max_entry_bytes
+        self.namespace = _config_namespace()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key_for(self, data):
+        """Cache key for encoded image bytes (bytes, bytearray or memoryview)."""
+        return f'emotion:{self.namespace}:{hashlib.blake2b(data, digest_size=16).hexdigest()}'
+
+    def get(self, key):
+        value = self._get(key)
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, results):
+        size = len(json.dumps(results))
+        if size <= self.max_entry_bytes:
+            self._set(key, results, size)
+
+    def stats(self):
+        with self._stats_lock:
+            total = self.hits + self.misses
+            return {
+                'backend': self.name,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+
+class LocalResultCache(BaseResultCache):
+    """In-process LRU cache bounded by entries, total bytes and TTL."""
+
+    name = 'local'
+
+    def __init__(self, ttl=300, max_entries=1024, max_bytes=16 * 1024 * 1024, max_entry_bytes=256 * 1024):
+        super().__init__(ttl, max_entry_bytes)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, size, results = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                return None
+            self._entries.move_to_end(key)
+            return results
+
+    def _set(self, key, results, size):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (time.monotonic() + self.ttl, size, results)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats.update({'entries': len(self._entries), 'bytes': self._bytes})
+        return stats
+
+
+class DjangoResultCache(BaseResultCache):
+    """Results stored in a cache from Django's cache framework."""
+
+    name = 'django'
+
+    def __init__(self, alias='default', ttl=300, max_entry_bytes=256 * 1024):
+        super().__init__(ttl, max_entry_bytes)
+        from django.core.cache import caches
+        self.cache = caches[alias]
+
+    def _get(self, key):
+        return self.cache.get(key)
+
+    def _set(self, key, results, size):
+        self.cache.set(key, results, timeout=self.ttl)
+
+
+def _config_namespace():
+    """Short hash of the settings that change detection results.
+
+    EMOTION_FACE_DETECTOR covers the detector backend and its options,
+    including the detection size (detect_size, min/max_face_size).
+    """
+    config = json.dumps([
+        str(getattr(settings, 'EMOTION_MODEL_PATH', '')),
+        getattr(settings, 'EMOTION_MODEL_BACKEND', None),
+        getattr(settings, 'EMOTION_FACE_DETECTOR', {}),
+    ], sort_keys=True, default=str)
+    return hashlib.blake2b(config.encode(), digest_size=4).hexdigest()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Return the configured result cache, or None if caching is disabled."""
+    global _cache
+    config = getattr(settings, 'EMOTION_RESULT_CACHE', {})
+    backend = config.get('BACKEND')
+    if not backend:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                ttl = config.get('TTL', 300)
+                max_entry_bytes = config.get('MAX_ENTRY_BYTES', 256 * 1024)
+                if backend == 'local':
+                    _cache = LocalResultCache(
+                        ttl=ttl,
+                        max_entries=config.get('MAX_ENTRIES', 1024),
+                        max_bytes=config.get('MAX_BYTES', 16 * 1024 * 1024),
+                        max_entry_bytes=max_entry_bytes,
+                    )
+                elif backend == 'django':
+                    _cache = DjangoResultCache(config.get('CACHE_ALIAS', 'default'), ttl, max_entry_bytes)
+                else:
+                    raise ValueError(f"Unknown result cache backend '{backend}'")
+    return _cache
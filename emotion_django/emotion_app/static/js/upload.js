@@ -95,6 +95,8 @@ async function analyzeImage() {
     
     const formData = new FormData();
     formData.append('image', selectedFile);
+    // A downscaled annotated image is enough for display
+    formData.append('annotate', 'preview');
     
     try {
         const response = await fetch('/api/detect/', {
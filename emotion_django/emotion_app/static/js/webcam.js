@@ -7,6 +7,13 @@ let ctx = null;
 let isDetecting = false;
 let detectionInterval = null;
 
+// Streaming detection over WebSocket (falls back to HTTP polling)
+const STREAM_URL = '/ws/detect/';
+const STREAM_MAX_FPS = 15;
+let socket = null;
+let frameCanvas = null;
+let lastFrameSent = 0;
+
 // Get CSRF token
 function getCookie(name) {
     let cookieValue = null;
@@ -80,6 +87,11 @@ function stopWebcam() {
         clearInterval(detectionInterval);
         detectionInterval = null;
     }
+    if (socket) {
+        socket.onclose = null;
+        socket.close();
+        socket = null;
+    }
     
     // Clear canvas
     if (ctx) {
@@ -108,6 +120,46 @@ function stopWebcam() {
 }
 
 function startContinuousDetection() {
+    if (!('WebSocket' in window)) {
+        startPollingDetection();
+        return;
+    }
+
+    const protocol = window.location.protocol === 'https:' ? 'wss://' : 'ws://';
+    socket = new WebSocket(protocol + window.location.host + STREAM_URL);
+    socket.binaryType = 'arraybuffer';
+
+    socket.onopen = () => {
+        sendStreamFrame();
+    };
+
+    socket.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (data.success) {
+            drawResults(data.results);
+            displayLiveResults(data.results);
+        }
+        // One frame in flight: only send the next frame once this result is back,
+        // so a slow server makes us skip frames instead of queueing them
+        if (data.busy) {
+            setTimeout(sendStreamFrame, 1000);
+        } else {
+            scheduleStreamFrame();
+        }
+    };
+
+    socket.onclose = () => {
+        socket = null;
+        // The server doesn't support streaming (e.g. plain WSGI runserver) or
+        // the connection dropped mid-session: keep detecting over HTTP
+        if (isDetecting) {
+            startPollingDetection();
+        }
+    };
+}
+
+function startPollingDetection() {
+    if (detectionInterval) return;
     // Detect every 1 second
     detectionInterval = setInterval(() => {
         if (isDetecting) {
@@ -116,30 +168,67 @@ function startContinuousDetection() {
     }, 1000);
 }
 
+function scheduleStreamFrame() {
+    const wait = Math.max(0, 1000 / STREAM_MAX_FPS - (performance.now() - lastFrameSent));
+    setTimeout(sendStreamFrame, wait);
+}
+
+function sendStreamFrame() {
+    if (!isDetecting || !socket || socket.readyState !== WebSocket.OPEN || !video) return;
+
+    // No frame yet (the camera is still starting up): try again shortly
+    if (!video.videoWidth) {
+        setTimeout(sendStreamFrame, 1000 / STREAM_MAX_FPS);
+        return;
+    }
+
+    if (!frameCanvas) {
+        frameCanvas = document.createElement('canvas');
+    }
+    frameCanvas.width = video.videoWidth;
+    frameCanvas.height = video.videoHeight;
+    frameCanvas.getContext('2d').drawImage(video, 0, 0);
+
+    frameCanvas.toBlob((blob) => {
+        if (!blob) {
+            // Encoding failed; the next frame is only sent after a result,
+            // so schedule it here or the stream stalls
+            setTimeout(sendStreamFrame, 1000 / STREAM_MAX_FPS);
+            return;
+        }
+        if (socket && socket.readyState === WebSocket.OPEN) {
+            lastFrameSent = performance.now();
+            socket.send(blob);
+        }
+    }, 'image/jpeg', 0.8);
+}
+
 async function captureFrame() {
-    if (!video || !canvas) return;
+    if (!video || !canvas || !video.videoWidth) return;
     
-    // Create temporary canvas to capture frame
-    const tempCanvas = document.createElement('canvas');
-    tempCanvas.width = video.videoWidth;
-    tempCanvas.height = video.videoHeight;
-    const tempCtx = tempCanvas.getContext('2d');
+    // Reuse one canvas to capture frames
+    if (!frameCanvas) {
+        frameCanvas = document.createElement('canvas');
+    }
+    frameCanvas.width = video.videoWidth;
+    frameCanvas.height = video.videoHeight;
     
     // Draw current video frame
-    tempCtx.drawImage(video, 0, 0);
+    frameCanvas.getContext('2d').drawImage(video, 0, 0);
     
-    // Convert to base64
-    const imageData = tempCanvas.toDataURL('image/jpeg', 0.8);
+    // Encode as JPEG and send the raw bytes (no base64 / JSON wrapping)
+    const blob = await new Promise(resolve => frameCanvas.toBlob(resolve, 'image/jpeg', 0.8));
+    if (!blob) return;
     
     // Send to server
     try {
-        const response = await fetch('/api/detect-webcam/', {
+        const response = await fetch('/api/detect-raw/', {
             method: 'POST',
             headers: {
-                'Content-Type': 'application/json',
+                'Content-Type': 'image/jpeg',
                 'X-CSRFToken': getCookie('csrftoken')
             },
-            body: JSON.stringify({ image: imageData })
+            body: blob
         });
         
         const data = await response.json();
@@ -0,0 +1,164 @@
+"""WebSocket endpoint streaming webcam frames for emotion detection.
+
+Served by the ASGI application in emotion_project/asgi.py at /ws/detect/.
+The client sends each frame as a binary JPEG message and receives a JSON text
+message per processed frame:
+
+    {"success": true, "frame": 12, "dropped": 3, "faces_detected": 1, "results": [...]}
+
+Backpressure: the client keeps at most one frame in flight and sends the next
+one only after the previous result arrives, so a slow server makes the client
+skip frames rather than queue them. If frames still pile up on the server,
+only the newest one is processed and the rest are counted in "dropped".
+
+Smoothing: faces are matched to earlier frames' faces by box IoU to get
+stable track IDs, and each connection feeds them to its own EmotionSmoother
+(settings.EMOTION_STREAM_SMOOTHING). A face is only re-classified when its
+crop changes noticeably or its track is due; otherwise its moving average is
+reused, so the reported emotion doesn't flicker between frames.
+
+Origin check: WebSocket routes bypass Django's middleware, so asgi.py calls
+`websocket_allowed` before handing over a connection. The Host header must
+match settings.ALLOWED_HOSTS, and a browser's Origin must either be the same
+host or be listed in settings.EMOTION_WS_ALLOWED_ORIGINS; otherwise the
+connection is closed with code 4003.
+"""
+import asyncio
+import itertools
+import json
+
+from django.conf import settings
+from django.http.request import split_domain_port, validate_host
+
+from emotion_smoothing import EmotionSmoother
+from face_tracking import box_iou
+
+from .emotion_utils import decode_image, detect_emotion_in_bytes, detect_emotion_smoothed
+from .workers import PoolSaturated, get_worker_pool
+
+
+class StreamTracks:
+    """Assign stable track IDs to the face boxes of successive frames by IoU."""
+
+    def __init__(self, iou_threshold=0.3, max_idle=30):
+        self.iou_threshold = iou_threshold
+        self.max_idle = max_idle
+        self._tracks = {}  # track ID -> (box, step last seen)
+        self._ids = itertools.count(1)
+        self._step = 0
+
+    def __call__(self, faces):
+        """Return one track ID per (x, y, w, h) box in `faces`."""
+        unmatched = dict(self._tracks)
+        ids = []
+        for box in faces:
+            box = tuple(int(v) for v in box)
+            scores = {track_id: box_iou(box, prev) for track_id, (prev, _) in unmatched.items()}
+            best = max(scores, key=scores.get, default=None)
+            if best is not None and scores[best] >= self.iou_threshold:
+                del unmatched[best]
+                track_id = best
+            else:
+                track_id = next(self._ids)
+            self._tracks[track_id] = (box, self._step)
+            ids.append(track_id)
+        self._tracks = {k: v for k, v in self._tracks.items() if self._step - v[1] <= self.max_idle}
+        self._step += 1
+        return ids
+
+
+def websocket_allowed(scope):
+    """True if a WebSocket connection's Host and Origin headers are allowed."""
+    headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope.get('headers', [])}
+    host = headers.get('host', '')
+    allowed_hosts = settings.ALLOWED_HOSTS
+    if settings.DEBUG and not allowed_hosts:
+        allowed_hosts = ['.localhost', '127.0.0.1', '[::1]']  # like Django's own DEBUG default
+    domain, _ = split_domain_port(host)
+    if not domain or not validate_host(domain, allowed_hosts):
+        return False
+
+    origin = headers.get('origin')
+    if origin is None:
+        return True  # not a browser; browsers always send Origin on WebSocket handshakes
+    allowed_origins = getattr(settings, 'EMOTION_WS_ALLOWED_ORIGINS', [])
+    if '*' in allowed_origins or origin in allowed_origins:
+        return True
+    # Same origin: the page was served from the host it is connecting to
+    return origin.split('://', 1)[-1] == host
+
+
+def _detect_from_jpeg(data, smoother=None, tracks=None):
+    try:
+        if smoother is None:
+            return detect_emotion_in_bytes(data)[1]
+        return detect_emotion_smoothed(decode_image(data), smoother, tracks)
+    except ValueError:
+        return None
+
+
+async def websocket_detect(scope, receive, send):
+    """ASGI handler for a single /ws/detect/ WebSocket connection."""
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    await send({'type': 'websocket.accept'})
+
+    state = {'frame': None, 'received': 0, 'dropped': 0, 'closed': False}
+    ready = asyncio.Event()
+
+    async def read_frames():
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                state['closed'] = True
+                ready.set()
+                return
+            data = message.get('bytes')
+            if data:
+                if state['frame'] is not None:
+                    state['dropped'] += 1  # superseded before we got to it
+                state['frame'] = data
+                state['received'] += 1
+                ready.set()
+
+    reader = asyncio.ensure_future(read_frames())
+    pool = get_worker_pool()
+    smoothing = getattr(settings, 'EMOTION_STREAM_SMOOTHING', None)
+    smoother = tracks = None
+    if smoothing is not None:
+        smoother = EmotionSmoother(**smoothing)
+        tracks = StreamTracks(max_idle=smoother.max_idle)
+    try:
+        while True:
+            await ready.wait()
+            ready.clear()
+            if state['closed']:
+                break
+            data, state['frame'] = state['frame'], None
+            if data is None:
+                continue
+
+            frame_number = state['received']
+            try:
+                results = await pool.run(_detect_from_jpeg, data, smoother, tracks)
+            except PoolSaturated:
+                payload = {'success': False, 'frame': frame_number, 'error': 'Server is busy', 'busy': True}
+            except Exception as e:
+                payload = {'success': False, 'frame': frame_number, 'error': str(e)}
+            else:
+                if results is None:
+                    payload = {'success': False, 'frame': frame_number, 'error': 'Invalid image data'}
+                else:
+                    payload = {
+                        'success': True,
+                        'frame': frame_number,
+                        'dropped': state['dropped'],
+                        'faces_detected': len(results),
+                        'results': results,
+                    }
+            if state['closed']:
+                break
+            await send({'type': 'websocket.send', 'text': json.dumps(payload)})
+    finally:
+        reader.cancel()
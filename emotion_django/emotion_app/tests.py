@@ -1,3 +1,83 @@
-from django.test import TestCase
+import asyncio
+import threading
 
-# Create your tests here.
+from django.test import SimpleTestCase, override_settings
+
+from .result_cache import _config_namespace
+from .streaming import StreamTracks, websocket_allowed
+from .workers import PoolSaturated, WorkerPool
+
+
+class StreamTracksTests(SimpleTestCase):
+    def test_faces_keep_their_ids_across_frames(self):
+        tracks = StreamTracks(max_idle=1)
+        first = tracks([(10, 10, 40, 40), (200, 10, 40, 40)])
+        # The first face moved slightly, the second is briefly out of view
+        self.assertEqual(tracks([(12, 10, 40, 40)]), first[:1])
+        self.assertEqual(tracks([(12, 10, 40, 40), (200, 12, 40, 40)]), first)
+        # Unseen for longer than max_idle: a new face gets a new ID
+        tracks([])
+        tracks([])
+        self.assertNotIn(tracks([(200, 12, 40, 40)])[0], first)
+
+
+class ResultCacheNamespaceTests(SimpleTestCase):
+    def test_backend_and_detection_size_change_the_namespace(self):
+        base = _config_namespace()
+        with self.settings(EMOTION_MODEL_BACKEND='tflite'):
+            self.assertNotEqual(_config_namespace(), base)
+        with self.settings(EMOTION_FACE_DETECTOR={'BACKEND': 'haar', 'OPTIONS': {'detect_size': 320}}):
+            self.assertNotEqual(_config_namespace(), base)
+
+
+def _scope(host, origin=None):
+    headers = [(b'host', host.encode())]
+    if origin is not None:
+        headers.append((b'origin', origin.encode()))
+    return {'type': 'websocket', 'headers': headers}
+
+
+@override_settings(ALLOWED_HOSTS=['example.com'], EMOTION_WS_ALLOWED_ORIGINS=['https://app.example.org'])
+class WebSocketOriginTests(SimpleTestCase):
+    def test_same_origin_and_listed_origins_are_allowed(self):
+        self.assertTrue(websocket_allowed(_scope('example.com', 'https://example.com')))
+        self.assertTrue(websocket_allowed(_scope('example.com', 'https://app.example.org')))
+        self.assertTrue(websocket_allowed(_scope('example.com')))
+
+    def test_foreign_origins_and_hosts_are_refused(self):
+        self.assertFalse(websocket_allowed(_scope('example.com', 'https://evil.test')))
+        self.assertFalse(websocket_allowed(_scope('evil.test', 'https://evil.test')))
+        self.assertFalse(websocket_allowed({'type': 'websocket', 'headers': []}))
+
+
+class WorkerPoolTests(SimpleTestCase):
+    def test_cancelled_job_keeps_its_slot_until_it_finishes(self):
+        pool = WorkerPool(max_workers=1, max_pending=0)
+        self.addCleanup(pool._executor.shutdown)
+        started = threading.Event()
+        finish = threading.Event()
+
+        def job():
+            started.set()
+            finish.wait(5)
+
+        async def scenario():
+            task = asyncio.ensure_future(pool.run(job))
+            await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+            # The job is still running, so the pool must still be full
+            with self.assertRaises(PoolSaturated):
+                await pool.run(lambda: None)
+            self.assertEqual(pool.stats()['in_flight'], 1)
+
+            finish.set()
+            for _ in range(200):
+                if pool.stats()['in_flight'] == 0:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertEqual(await pool.run(lambda: 42), 42)
+
+        asyncio.run(scenario())
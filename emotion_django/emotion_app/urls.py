@@ -6,6 +6,9 @@ urlpatterns = [
     path('upload/', views.upload_page, name='upload'),
     path('webcam/', views.webcam_page, name='webcam'),
     path('about/', views.about_page, name='about'),
-    path('api/detect/', views.detect_emotion, name='detect_emotion'),
-    path('api/detect-webcam/', views.detect_emotion_webcam, name='detect_emotion_webcam'),
+    path('api/detect/', views.detect_emotion_async, name='detect_emotion'),
+    path('api/detect-webcam/', views.detect_emotion_webcam_async, name='detect_emotion_webcam'),
+    path('api/detect-raw/', views.detect_emotion_raw_async, name='detect_emotion_raw'),
+    path('api/stats/', views.inference_stats, name='inference_stats'),
+    path('metrics', views.metrics_view, name='metrics'),
 ]
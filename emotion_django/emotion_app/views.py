@@ -1,13 +1,26 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
 import cv2
-import numpy as np
 import base64
 import json
-from .emotion_utils import detect_emotion_in_image, predict_single_emotion
+from .emotion_utils import detect_emotion_in_bytes, peek_scheduler
+from .batching import InferenceScheduler
+from .result_cache import get_result_cache
+from .workers import PoolSaturated, get_worker_pool
+import metrics
+
+try:
+    import msgpack
+except ImportError:  # MessagePack responses are optional
+    msgpack = None
+
+RAW_CONTENT_TYPES = ('image/jpeg', 'image/png', 'application/octet-stream')
+RESPONSE_FORMATS = ('json', 'lean', 'msgpack')
+ANNOTATION_MODES = ('none', 'preview', 'full')
 
 
 def index(request):
@@ -25,21 +38,69 @@ def webcam_page(request):
     return render(request, 'webcam.html')
 
 
+def annotate_image(image, results, max_dim=None, jpeg_quality=85):
+    """Draw result boxes and labels and return the image as a JPEG data URL.
+    
+    Draws in place: `image` is modified, so pass a copy if the original is
+    still needed. With `max_dim`, the image is first downscaled so its longer
+    side is at most `max_dim` pixels (boxes are scaled to match), which makes
+    drawing, encoding and the response much cheaper for large uploads.
+    """
+    scale = 1.0
+    if max_dim and max(image.shape[:2]) > max_dim:
+        scale = max_dim / max(image.shape[:2])
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    
+    for result in results:
+        box = result['box']
+        x, y = int(box['x'] * scale), int(box['y'] * scale)
+        w, h = int(box['width'] * scale), int(box['height'] * scale)
+        
+        # Draw rectangle
+        cv2.rectangle(image, (x, y), (x+w, y+h), (0, 255, 0), 2)
+        
+        # Draw label
+        label = f"{result['emotion']} ({result['confidence']*100:.1f}%)"
+        cv2.putText(image, label, (x, y-10), 
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+    
+    # Encode result image to base64
+    quality = max(1, min(100, int(jpeg_quality)))
+    _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return f"data:image/jpeg;base64,{base64.b64encode(buffer).decode('utf-8')}"
+
+
 @csrf_exempt
 def detect_emotion(request):
-    """API endpoint to detect emotion from uploaded image."""
+    """API endpoint to detect emotion from uploaded image.
+    
+    Optional `annotate` field (form field or query parameter) controls the
+    annotated `result_image` in the response:
+        none     no result image (cheapest; boxes are in `results`)
+        preview  downscaled to EMOTION_ANNOTATION_PREVIEW_MAX_DIM
+        full     full resolution (default, see EMOTION_ANNOTATION_DEFAULT)
+    `jpeg_quality` overrides EMOTION_ANNOTATION_JPEG_QUALITY.
+    """
     if request.method != 'POST':
         return JsonResponse({'error': 'POST request required'}, status=400)
     
+    annotate = request.POST.get('annotate') or request.GET.get('annotate') or \
+        getattr(settings, 'EMOTION_ANNOTATION_DEFAULT', 'full')
+    if annotate not in ANNOTATION_MODES:
+        return JsonResponse({'error': f'Unknown annotate mode: {annotate}'}, status=400)
+    try:
+        jpeg_quality = int(request.POST.get('jpeg_quality') or request.GET.get('jpeg_quality') or
+                           getattr(settings, 'EMOTION_ANNOTATION_JPEG_QUALITY', 85))
+    except ValueError:
+        return JsonResponse({'error': 'jpeg_quality must be an integer'}, status=400)
+    
     try:
         # Check if image file is uploaded
         if 'image' in request.FILES:
             image_file = request.FILES['image']
             
             # Read image file
-            image_data = image_file.read()
-            nparr = np.frombuffer(image_data, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            image_bytes = image_file.read()
             
         # Check if base64 image is sent
         elif 'image_data' in request.POST:
@@ -51,42 +112,32 @@ def detect_emotion(request):
             
             # Decode base64
             image_bytes = base64.b64decode(image_data)
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
             
         else:
             return JsonResponse({'error': 'No image provided'}, status=400)
         
-        if image is None:
+        # Detect emotions (cached by image hash; decode only if we annotate)
+        try:
+            image, results = detect_emotion_in_bytes(image_bytes, need_image=annotate != 'none')
+        except ValueError:
             return JsonResponse({'error': 'Invalid image data'}, status=400)
         
-        # Detect emotions
-        results = detect_emotion_in_image(image)
-        
-        # Draw boxes on image for visualization
-        output_image = image.copy()
-        for result in results:
-            box = result['box']
-            x, y, w, h = box['x'], box['y'], box['width'], box['height']
-            
-            # Draw rectangle
-            cv2.rectangle(output_image, (x, y), (x+w, y+h), (0, 255, 0), 2)
-            
-            # Draw label
-            label = f"{result['emotion']} ({result['confidence']*100:.1f}%)"
-            cv2.putText(output_image, label, (x, y-10), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-        
-        # Encode result image to base64
-        _, buffer = cv2.imencode('.jpg', output_image)
-        result_image_base64 = base64.b64encode(buffer).decode('utf-8')
-        
-        return JsonResponse({
+        response = {
             'success': True,
             'faces_detected': len(results),
             'results': results,
-            'result_image': f'data:image/jpeg;base64,{result_image_base64}'
-        })
+        }
+        if annotate != 'none':
+            # The decoded image isn't needed after this, so draw on it directly
+            with metrics.timed('annotate'):
+                response['result_image'] = annotate_image(
+                    image, results,
+                    max_dim=getattr(settings, 'EMOTION_ANNOTATION_PREVIEW_MAX_DIM', 800) if annotate == 'preview' else None,
+                    jpeg_quality=jpeg_quality,
+                )
+        
+        with metrics.timed('encode'):
+            return JsonResponse(response)
         
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
@@ -111,25 +162,157 @@ def detect_emotion_webcam(request):
         
         # Decode base64
         image_bytes = base64.b64decode(image_data)
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         
-        if image is None:
+        # Detect emotions (cached by image hash)
+        try:
+            _, results = detect_emotion_in_bytes(image_bytes)
+        except ValueError:
             return JsonResponse({'error': 'Invalid image data'}, status=400)
         
-        # Detect emotions
-        results = detect_emotion_in_image(image)
+        with metrics.timed('encode'):
+            return JsonResponse({
+                'success': True,
+                'faces_detected': len(results),
+                'results': results
+            })
         
-        return JsonResponse({
-            'success': True,
-            'faces_detected': len(results),
-            'results': results
-        })
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def lean_results(results):
+    """Compact result schema: box as [x, y, w, h], no per-class probabilities."""
+    return [
+        {
+            'box': [r['box']['x'], r['box']['y'], r['box']['width'], r['box']['height']],
+            'emotion': r['emotion'],
+            'confidence': round(r['confidence'], 4),
+        }
+        for r in results
+    ]
+
+
+@csrf_exempt
+def detect_emotion_raw(request):
+    """API endpoint taking the raw encoded image as the request body.
+    
+    Accepts `image/jpeg`, `image/png` or `application/octet-stream` bodies and
+    decodes them straight from the request buffer (no base64, no JSON).
+    Query options:
+        format=lean     compact JSON without all_predictions
+        format=msgpack  compact MessagePack response (requires `msgpack`)
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST request required'}, status=400)
+    
+    content_type = request.content_type or ''
+    if content_type not in RAW_CONTENT_TYPES:
+        return JsonResponse({'error': f'Unsupported content type: {content_type or "none"}'}, status=415)
+    
+    response_format = request.GET.get('format', 'json')
+    if response_format not in RESPONSE_FORMATS:
+        return JsonResponse({'error': f'Unknown format: {response_format}'}, status=400)
+    if response_format == 'msgpack' and msgpack is None:
+        return JsonResponse({'error': 'MessagePack responses require the msgpack package'}, status=406)
+    
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    if length <= 0:
+        return JsonResponse({'error': 'No image data provided'}, status=400)
+    max_bytes = getattr(settings, 'EMOTION_RAW_UPLOAD_MAX_BYTES', 20 * 1024 * 1024)
+    if length > max_bytes:
+        return JsonResponse({'error': f'Image larger than {max_bytes} bytes'}, status=413)
+    
+    try:
+        # Read the body straight from the stream; it is hashed and decoded without further copies
+        try:
+            _, results = detect_emotion_in_bytes(request.read(length))
+        except ValueError:
+            return JsonResponse({'error': 'Invalid image data'}, status=400)
+        
+        with metrics.timed('encode'):
+            if response_format == 'json':
+                return JsonResponse({
+                    'success': True,
+                    'faces_detected': len(results),
+                    'results': results
+                })
+            
+            payload = {'success': True, 'faces_detected': len(results), 'results': lean_results(results)}
+            if response_format == 'msgpack':
+                return HttpResponse(msgpack.packb(payload), content_type='application/msgpack')
+            return JsonResponse(payload)
         
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
 
+def busy_response():
+    """503 response telling the client when to retry."""
+    response = JsonResponse({'error': 'Server is busy, please retry shortly'}, status=503)
+    response['Retry-After'] = str(getattr(settings, 'EMOTION_RETRY_AFTER_SECONDS', 1))
+    return response
+
+
+def offload(view):
+    """Turn a sync detection view into an async view running on the worker pool.
+    
+    The CPU-bound work (decode, detect, classify, annotate) runs on the bounded
+    pool from workers.py; when it is saturated the client gets 503 with
+    Retry-After instead of waiting in an unbounded queue.
+    """
+    async def async_view(request, *args, **kwargs):
+        metrics.REQUESTS_IN_FLIGHT.inc()
+        try:
+            return await get_worker_pool().run(view, request, *args, **kwargs)
+        except PoolSaturated:
+            return busy_response()
+        finally:
+            metrics.REQUESTS_IN_FLIGHT.dec()
+            metrics.REQUESTS_TOTAL.inc()
+    
+    async_view.__name__ = f'{view.__name__}_async'
+    async_view.__doc__ = f'Async version of {view.__name__} (served via asgi.py).'
+    async_view.csrf_exempt = True
+    return async_view
+
+
+detect_emotion_async = offload(detect_emotion)
+detect_emotion_webcam_async = offload(detect_emotion_webcam)
+detect_emotion_raw_async = offload(detect_emotion_raw)
+
+
+def inference_stats(request):
+    """API endpoint exposing micro-batching and worker pool metrics.
+    
+    Read-only: it never loads the model or starts the scheduler, so the
+    batching stats are zero until the first detection request.
+    """
+    stats = {'workers': get_worker_pool().stats()}
+    cache = get_result_cache()
+    stats['result_cache'] = cache.stats() if cache is not None else None
+    if not getattr(settings, 'EMOTION_BATCH_ENABLED', True):
+        return JsonResponse({'batching_enabled': False, **stats})
+    scheduler = peek_scheduler()
+    if scheduler is None:
+        batching = InferenceScheduler.empty_stats(
+            getattr(settings, 'EMOTION_BATCH_MAX_SIZE', 32),
+            getattr(settings, 'EMOTION_BATCH_MAX_WAIT_MS', 5.0),
+        )
+    else:
+        batching = scheduler.stats()
+    return JsonResponse({'batching_enabled': True, **batching, **stats})
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint with per-stage timings and request gauges."""
+    if not metrics.is_enabled():
+        return HttpResponse('Metrics are disabled (EMOTION_METRICS_ENABLED)\n', status=404, content_type='text/plain')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 def about_page(request):
     """About page with information about the emotion detection system."""
     return render(request, 'about.html')
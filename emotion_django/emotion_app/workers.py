@@ -0,0 +1,83 @@
+"""Bounded worker pool for CPU-bound detection work under async views.
+
+Async views hand image decoding, face detection, classification and
+annotation to a shared thread pool so the event loop stays free to serve many
+slow clients. Admission control caps the work in the process: at most
+`max_workers` jobs run and `max_pending` wait; beyond that, `run()` raises
+PoolSaturated immediately and the view answers 503 with Retry-After instead
+of queueing without bound.
+
+Threads (rather than processes) are used on purpose: OpenCV and TensorFlow
+release the GIL in their kernels, and all workers share one loaded model
+instead of importing TensorFlow once per process.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+
+class PoolSaturated(Exception):
+    """Raised when the worker pool has no room for another job."""
+
+
+class WorkerPool:
+    def __init__(self, max_workers=4, max_pending=16):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='emotion-worker')
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the pool, or raise PoolSaturated if it is full."""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PoolSaturated()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._release()
+            raise
+        # The slot is freed when the job finishes, not when the awaiting
+        # coroutine does: a cancelled request (client disconnect, timeout)
+        # keeps its slot while its thread is still running
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, future=None):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'in_flight': self.in_flight,
+                'rejected': self.rejected,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool():
+    """Return the process-wide worker pool configured in settings."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = WorkerPool(
+                    max_workers=getattr(settings, 'EMOTION_WORKER_THREADS', 4),
+                    max_pending=getattr(settings, 'EMOTION_WORKER_MAX_PENDING', 16),
+                )
+    return _pool
@@ -2,6 +2,11 @@
 ASGI config for emotion_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests go to Django; WebSocket connections to /ws/detect/ are handled by
+the streaming emotion detection endpoint (emotion_app/streaming.py).
+
+Run with an ASGI server, e.g.:
+    uvicorn emotion_project.asgi:application
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
@@ -13,4 +18,32 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'emotion_project.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Import after Django is set up so the app registry and settings are ready
+from emotion_app.detectors import preload_face_detectors  # noqa: E402
+from emotion_app.streaming import websocket_allowed, websocket_detect  # noqa: E402
+
+# Load the face detector before the first request (settings.EMOTION_PRELOAD_DETECTORS)
+preload_face_detectors()
+
+WEBSOCKET_ROUTES = {
+    '/ws/detect/': websocket_detect,
+}
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        handler = WEBSOCKET_ROUTES.get(scope['path'])
+        if handler is None:
+            await receive()
+            await send({'type': 'websocket.close', 'code': 4404})
+            return
+        # Django's middleware doesn't run here, so check Host and Origin ourselves
+        if not websocket_allowed(scope):
+            await receive()
+            await send({'type': 'websocket.close', 'code': 4003})
+            return
+        await handler(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
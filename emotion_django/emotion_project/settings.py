@@ -12,10 +12,15 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Make the shared modules in the repository root (e.g. face_detectors.py) importable
+if str(BASE_DIR.parent) not in sys.path:
+    sys.path.append(str(BASE_DIR.parent))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
@@ -131,3 +136,77 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Emotion Model Path (relative to BASE_DIR parent)
 EMOTION_MODEL_PATH = os.path.join(BASE_DIR.parent, 'emotion_model_final.h5')
+
+# Inference backend: 'keras', 'tflite' or 'onnx' (None infers it from the file extension).
+# TFLite / ONNX artifacts are created with export_model.py and avoid loading TensorFlow.
+EMOTION_MODEL_BACKEND = None
+
+# Cross-request micro-batching of model inference.
+# Faces from concurrent requests are gathered into one predict call of up to
+# EMOTION_BATCH_MAX_SIZE faces, waiting at most EMOTION_BATCH_MAX_WAIT_MS.
+EMOTION_BATCH_ENABLED = True
+EMOTION_BATCH_MAX_SIZE = 32
+EMOTION_BATCH_MAX_WAIT_MS = 5
+
+# Number of face detector instances to load when the server starts (runserver,
+# asgi.py, wsgi.py; other management commands never preload). 0 disables it.
+# Detectors are pooled and reused; the pool grows on demand under concurrency.
+EMOTION_PRELOAD_DETECTORS = 1
+
+# Face detector backend and its tuning parameters (see face_detectors.py).
+# Backends: 'haar', 'lbp', 'ssd' (OpenCV DNN res10 SSD), 'yunet' (OpenCV DNN YuNet).
+# e.g. {'BACKEND': 'yunet', 'OPTIONS': {'model_path': '/path/to/face_detection_yunet_2023mar.onnx'}}
+# Every backend also accepts:
+#   detect_size: detect on a copy downscaled so its longer side is at most this many
+#                pixels; boxes are mapped back and faces are cropped at full resolution
+#   min_face_size / max_face_size: face sizes (original-image pixels) to search for
+EMOTION_FACE_DETECTOR = {
+    'BACKEND': 'haar',
+    'OPTIONS': {'scale_factor': 1.3, 'min_neighbors': 5, 'detect_size': 640},
+}
+
+# Largest request body accepted by the raw binary endpoint (/api/detect-raw/).
+EMOTION_RAW_UPLOAD_MAX_BYTES = 20 * 1024 * 1024
+
+# Annotated result image returned by /api/detect/ ('annotate' request option).
+# Modes: 'none' (boxes only), 'preview' (downscaled) or 'full' (full resolution).
+EMOTION_ANNOTATION_DEFAULT = 'full'
+EMOTION_ANNOTATION_PREVIEW_MAX_DIM = 800
+EMOTION_ANNOTATION_JPEG_QUALITY = 85
+
+# Worker pool for the async detection views and the WebSocket endpoint.
+# At most EMOTION_WORKER_THREADS jobs run and EMOTION_WORKER_MAX_PENDING wait;
+# further requests get 503 with a Retry-After of EMOTION_RETRY_AFTER_SECONDS.
+EMOTION_WORKER_THREADS = 4
+EMOTION_WORKER_MAX_PENDING = 16
+EMOTION_RETRY_AFTER_SECONDS = 1
+
+# Origins (e.g. 'https://example.com') other than the site itself that may open
+# the /ws/detect/ WebSocket; '*' allows any. Same-origin pages are always allowed.
+EMOTION_WS_ALLOWED_ORIGINS = []
+
+# Per-connection emotion smoothing on the WebSocket stream (EmotionSmoother
+# options, see emotion_smoothing.py), or None to classify every face on every
+# frame. Unchanged faces reuse their moving average instead of being re-classified.
+EMOTION_STREAM_SMOOTHING = {
+    'alpha': 0.5,            # weight of each new prediction
+    'reclassify_every': 10,  # frames between forced re-classifications
+    'diff_threshold': 6.0,   # mean pixel change that counts as a new crop
+    'max_idle': 30,          # frames before an unseen face is forgotten
+}
+
+# Cache of detection results for repeated images, keyed by a hash of the image bytes.
+# BACKEND: 'local' (in-process LRU), 'django' (uses CACHES[CACHE_ALIAS], e.g. a
+# file-based or locmem cache) or None to disable.
+EMOTION_RESULT_CACHE = {
+    'BACKEND': 'local',
+    'TTL': 300,                       # seconds
+    'MAX_ENTRIES': 1024,
+    'MAX_BYTES': 16 * 1024 * 1024,    # total size of cached results ('local' only)
+    'MAX_ENTRY_BYTES': 256 * 1024,    # results larger than this are not cached
+    'CACHE_ALIAS': 'default',         # 'django' backend only
+}
+
+# Prometheus-style metrics (per-stage timings, faces per image, model load time,
+# in-flight requests) served at /metrics. Near-zero overhead when disabled.
+EMOTION_METRICS_ENABLED = True
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'emotion_project.settings')
 
 application = get_wsgi_application()
+
+# Load the face detector before the first request (settings.EMOTION_PRELOAD_DETECTORS)
+from emotion_app.detectors import preload_face_detectors  # noqa: E402
+
+preload_face_detectors()
@@ -0,0 +1,95 @@
+"""Per-track temporal smoothing of emotion predictions.
+
+EmotionSmoother keeps, for every tracked face, an exponential moving average of
+the 7-class probabilities and the 48x48 grayscale crop it was last classified
+on. A face is only re-classified when its crop has changed noticeably (mean
+absolute pixel difference on a small thumbnail), when it hasn't been
+classified for `reclassify_every` steps, or when it is new; otherwise the cached
+distribution is reused. Tracks not seen for `max_idle` steps are evicted.
+
+Tracks are identified by any hashable key (e.g. FaceTracker track IDs), and a
+"step" is one frame or one request of the stream being smoothed.
+"""
+import cv2
+import numpy as np
+
+
+class TrackState:
+    def __init__(self, probs, thumb, step):
+        self.probs = probs
+        self.thumb = thumb
+        self.last_classified = step
+        self.last_seen = step
+
+
+class EmotionSmoother:
+    """EMA of class probabilities per track, with change-based classification skipping."""
+
+    def __init__(self, alpha=0.5, reclassify_every=10, diff_threshold=6.0, max_idle=30, thumb_size=16):
+        self.alpha = alpha
+        self.reclassify_every = max(1, int(reclassify_every))
+        self.diff_threshold = diff_threshold
+        self.max_idle = max_idle
+        self.thumb_size = thumb_size
+        self.states = {}
+        self.step = 0
+        self.classified = 0
+        self.skipped = 0
+
+    def _thumb(self, crop):
+        # Downsample before comparing so sensor noise doesn't count as change
+        return cv2.resize(crop, (self.thumb_size, self.thumb_size), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def needs_classification(self, key, crop):
+        """Return True if `crop` (uint8 48x48 grayscale) should be sent to the model."""
+        state = self.states.get(key)
+        if state is None or self.step - state.last_classified >= self.reclassify_every:
+            return True
+        diff = float(np.mean(np.abs(self._thumb(crop) - state.thumb)))
+        return diff > self.diff_threshold
+
+    def update(self, key, probs, crop):
+        """Fold freshly predicted `probs` for `key` into its moving average."""
+        probs = np.asarray(probs, dtype=np.float32)
+        state = self.states.get(key)
+        if state is None:
+            self.states[key] = TrackState(probs, self._thumb(crop), self.step)
+        else:
+            state.probs = self.alpha * probs + (1.0 - self.alpha) * state.probs
+            state.thumb = self._thumb(crop)
+            state.last_classified = self.step
+            state.last_seen = self.step
+        self.classified += 1
+        return self.states[key].probs
+
+    def reuse(self, key):
+        """Return the cached distribution for `key` without re-classifying."""
+        state = self.states[key]
+        state.last_seen = self.step
+        self.skipped += 1
+        return state.probs
+
+    def advance(self):
+        """Move to the next step and evict tracks that have gone stale."""
+        self.step += 1
+        stale = [k for k, s in self.states.items() if self.step - s.last_seen > self.max_idle]
+        for key in stale:
+            del self.states[key]
+
+    def classify(self, keys, crops, predict_fn):
+        """Return smoothed probabilities for every key, running predict_fn only where needed.
+
+        crops: uint8 (48, 48) grayscale face crops, one per key.
+        predict_fn: callable taking a list of indices into `crops` and returning
+        an (n, num_classes) array of probabilities for them.
+        """
+        todo = [i for i, (k, c) in enumerate(zip(keys, crops)) if self.needs_classification(k, c)]
+        results = [None] * len(keys)
+        if todo:
+            for i, probs in zip(todo, predict_fn(todo)):
+                results[i] = self.update(keys[i], probs, crops[i])
+        for i, key in enumerate(keys):
+            if results[i] is None:
+                results[i] = self.reuse(key)
+        self.advance()
+        return results
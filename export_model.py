@@ -0,0 +1,96 @@
+"""Export the trained Keras emotion model to TFLite and ONNX for lightweight CPU inference.
+
+Usage:
+    python export_model.py --model emotion_model.h5
+    python export_model.py --model emotion_model.h5 --formats tflite --check
+
+Writes `<model>.tflite` and/or `<model>.onnx` next to the Keras model (or to
+`--out-dir`). With `--check`, every exported artifact is loaded through
+`inference_backends.load_model` and its outputs are compared against the Keras
+model on the same inputs; the script exits non-zero if they disagree.
+ONNX export requires `tf2onnx`.
+"""
+import argparse
+import os
+import sys
+import numpy as np
+import tensorflow as tf
+from inference_backends import load_model
+
+
+def export_tflite(model, out_path):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    tflite_model = converter.convert()
+    with open(out_path, 'wb') as f:
+        f.write(tflite_model)
+    return out_path
+
+
+def export_onnx(model, out_path, opset=13):
+    import tf2onnx
+    spec = (tf.TensorSpec((None, *model.input_shape[1:]), tf.float32, name='input'),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=opset, output_path=out_path)
+    return out_path
+
+
+def check_parity(model, path, batch_sizes=(1, 7, 32), atol=1e-4):
+    """Compare an exported artifact's outputs with the Keras model's.
+
+    Returns True if every output is within `atol` and the predicted classes match.
+    """
+    backend = load_model(path)
+    rng = np.random.default_rng(0)
+    ok = True
+    for n in batch_sizes:
+        batch = rng.random((n, *model.input_shape[1:]), dtype=np.float32)
+        expected = model.predict(batch, verbose=0)
+        actual = backend.predict(batch)
+        max_diff = float(np.max(np.abs(expected - actual)))
+        agree = float(np.mean(np.argmax(expected, axis=1) == np.argmax(actual, axis=1)))
+        passed = max_diff <= atol and agree == 1.0
+        ok = ok and passed
+        print(f'  {os.path.basename(path)} batch={n:<3} max_abs_diff={max_diff:.2e} argmax_agreement={agree:.3f} '
+              f"{'OK' if passed else 'MISMATCH'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', type=str, default='emotion_model.h5', help='Path to trained Keras .h5 model')
+    parser.add_argument('--formats', type=str, nargs='+', default=['tflite', 'onnx'], choices=['tflite', 'onnx'],
+                        help='Artifacts to export')
+    parser.add_argument('--out-dir', type=str, default=None, help='Output directory (default: next to the model)')
+    parser.add_argument('--opset', type=int, default=13, help='ONNX opset version')
+    parser.add_argument('--check', action='store_true', help='Verify exported outputs match the Keras model')
+    parser.add_argument('--atol', type=float, default=1e-4, help='Max absolute difference allowed by --check')
+    args = parser.parse_args()
+
+    print('Loading model:', args.model)
+    model = tf.keras.models.load_model(args.model)
+
+    out_dir = args.out_dir or os.path.dirname(os.path.abspath(args.model))
+    os.makedirs(out_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(args.model))[0]
+
+    exported = []
+    for fmt in args.formats:
+        out_path = os.path.join(out_dir, f'{stem}.{fmt}')
+        if fmt == 'tflite':
+            export_tflite(model, out_path)
+        else:
+            export_onnx(model, out_path, opset=args.opset)
+        size_kb = os.path.getsize(out_path) / 1024
+        print(f'Exported {fmt}: {out_path} ({size_kb:.1f} KB)')
+        exported.append(out_path)
+
+    if args.check:
+        print('Checking parity against Keras outputs...')
+        results = [check_parity(model, path, atol=args.atol) for path in exported]
+        if not all(results):
+            print('Parity check FAILED')
+            sys.exit(1)
+        print('Parity check passed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""Interchangeable CPU face-detector backends.
+
+Every backend implements `detect(image)` and returns a list of (x, y, w, h)
+boxes in image coordinates. Backends are created by name with their own
+tuning parameters:
+
+    detector = create_detector('haar', scale_factor=1.1, min_neighbors=5)
+    detector = create_detector('ssd', model_dir='models/', confidence=0.6)
+    detector = create_detector('yunet', model_path='face_detection_yunet_2023mar.onnx')
+    detector = create_detector('lbp', model_path='lbpcascade_frontalface_improved.xml')
+
+Any backend can run on a downscaled copy of the input and skip face sizes that
+can't occur for the camera geometry; boxes are always returned in the
+coordinates of the original image, so faces can be cropped from it at full
+resolution:
+
+    detector = create_detector('haar', detect_size=640, min_face_size=60, max_face_size=400)
+
+Detector instances are not thread-safe; use one instance per thread.
+The DNN backends need model files that are not bundled with opencv-python:
+- ssd: `deploy.prototxt` and `res10_300x300_ssd_iter_140000.caffemodel`
+  (OpenCV's face detector sample, https://github.com/opencv/opencv/tree/master/samples/dnn/face_detector)
+- yunet: `face_detection_yunet_2023mar.onnx` (https://github.com/opencv/opencv_zoo/tree/main/models/face_detection_yunet)
+- lbp: `lbpcascade_frontalface_improved.xml` (https://github.com/opencv/opencv/tree/master/data/lbpcascades)
+"""
+import os
+import cv2
+import numpy as np
+
+
+def _find_file(path, filename, search_dirs=()):
+    """Return `path` if given, else the first existing `filename` in search_dirs."""
+    if path:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f'Face detector model not found: {path}')
+        return path
+    for d in search_dirs:
+        candidate = os.path.join(d, filename)
+        if os.path.exists(candidate):
+            return candidate
+    raise FileNotFoundError(f'{filename} not found. Download it and pass its path via model_path.')
+
+
+def _clip_boxes(boxes, shape):
+    """Clip (x, y, w, h) boxes to the image and drop empty ones."""
+    h_img, w_img = shape[:2]
+    clipped = []
+    for x, y, w, h in boxes:
+        x0, y0 = max(int(x), 0), max(int(y), 0)
+        x1, y1 = min(int(x + w), w_img), min(int(y + h), h_img)
+        if x1 > x0 and y1 > y0:
+            clipped.append((x0, y0, x1 - x0, y1 - y0))
+    return clipped
+
+
+def _filter_size(boxes, min_size=None, max_size=None):
+    """Drop boxes whose longer side is outside [min_size, max_size] pixels."""
+    if not min_size and not max_size:
+        return boxes
+    kept = []
+    for box in boxes:
+        side = max(box[2], box[3])
+        if min_size and side < min_size:
+            continue
+        if max_size and side > max_size:
+            continue
+        kept.append(box)
+    return kept
+
+
+class FaceDetector:
+    """Base class for face detectors."""
+
+    name = None
+    # True if detect() wants a BGR image; False if grayscale is enough
+    needs_color = False
+
+    def detect(self, image, min_size=None, max_size=None):
+        """Return a list of (x, y, w, h) face boxes for a BGR or grayscale image.
+
+        Faces smaller than `min_size` or larger than `max_size` pixels are skipped.
+        """
+        raise NotImplementedError
+
+
+class CascadeDetector(FaceDetector):
+    """OpenCV cascade classifier (Haar or LBP features)."""
+
+    filename = None
+    search_dirs = ()
+
+    def __init__(self, model_path=None, scale_factor=1.3, min_neighbors=5, min_size=None, max_size=None):
+        path = _find_file(model_path, self.filename, self.search_dirs)
+        self.cascade = cv2.CascadeClassifier(path)
+        if self.cascade.empty():
+            raise ValueError(f'Could not load cascade from {path}')
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+        self.max_size = max_size
+
+    def detect(self, image, min_size=None, max_size=None):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        min_size = min_size or self.min_size
+        max_size = max_size or self.max_size
+        kwargs = {'scaleFactor': self.scale_factor, 'minNeighbors': self.min_neighbors}
+        # The cascade skips the pyramid levels outside these sizes entirely
+        if min_size:
+            kwargs['minSize'] = (int(min_size), int(min_size))
+        if max_size:
+            kwargs['maxSize'] = (int(max_size), int(max_size))
+        faces = self.cascade.detectMultiScale(gray, **kwargs)
+        return [tuple(int(v) for v in f) for f in faces]
+
+
+class HaarDetector(CascadeDetector):
+    name = 'haar'
+    filename = 'haarcascade_frontalface_default.xml'
+    search_dirs = (cv2.data.haarcascades, '.')
+
+
+class LBPDetector(CascadeDetector):
+    name = 'lbp'
+    filename = 'lbpcascade_frontalface_improved.xml'
+    search_dirs = ('.', 'models', os.path.join(cv2.data.haarcascades, '..', 'lbpcascades'))
+
+    def __init__(self, model_path=None, scale_factor=1.1, min_neighbors=3, min_size=None, max_size=None):
+        super().__init__(model_path, scale_factor, min_neighbors, min_size, max_size)
+
+
+class SSDDetector(FaceDetector):
+    """OpenCV DNN ResNet-10 SSD face detector (Caffe model)."""
+
+    name = 'ssd'
+    needs_color = True
+
+    def __init__(self, model_dir='models', prototxt=None, model_path=None, confidence=0.5, input_size=300):
+        prototxt = _find_file(prototxt, 'deploy.prototxt', (model_dir, '.'))
+        model_path = _find_file(model_path, 'res10_300x300_ssd_iter_140000.caffemodel', (model_dir, '.'))
+        self.net = cv2.dnn.readNetFromCaffe(prototxt, model_path)
+        self.confidence = confidence
+        self.input_size = int(input_size)
+
+    def detect(self, image, min_size=None, max_size=None):
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        h, w = image.shape[:2]
+        size = (self.input_size, self.input_size)
+        blob = cv2.dnn.blobFromImage(cv2.resize(image, size), 1.0, size, (104.0, 177.0, 123.0))
+        self.net.setInput(blob)
+        detections = self.net.forward()[0, 0]
+        detections = detections[detections[:, 2] >= self.confidence]
+        boxes = []
+        for x0, y0, x1, y1 in detections[:, 3:7] * np.array([w, h, w, h]):
+            boxes.append((x0, y0, x1 - x0, y1 - y0))
+        return _filter_size(_clip_boxes(boxes, image.shape), min_size, max_size)
+
+
+class YuNetDetector(FaceDetector):
+    """OpenCV YuNet face detector (ONNX model, requires OpenCV >= 4.5.4)."""
+
+    name = 'yunet'
+    needs_color = True
+
+    def __init__(self, model_path=None, model_dir='models', score_threshold=0.6, nms_threshold=0.3, top_k=5000):
+        model_path = _find_file(model_path, 'face_detection_yunet_2023mar.onnx', (model_dir, '.'))
+        self.detector = cv2.FaceDetectorYN.create(model_path, '', (320, 320), score_threshold, nms_threshold, top_k)
+        self._input_size = (320, 320)
+
+    def detect(self, image, min_size=None, max_size=None):
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        size = (image.shape[1], image.shape[0])
+        if size != self._input_size:
+            self.detector.setInputSize(size)
+            self._input_size = size
+        _, faces = self.detector.detect(image)
+        if faces is None:
+            return []
+        return _filter_size(_clip_boxes(faces[:, :4], image.shape), min_size, max_size)
+
+
+class DownscaledDetector(FaceDetector):
+    """Run a detector on a downscaled copy of the image and map boxes back.
+
+    `detect_size` caps the longer side of the image the wrapped detector sees;
+    `min_face_size` / `max_face_size` are face sizes in original-image pixels.
+    """
+
+    def __init__(self, detector, detect_size=None, min_face_size=None, max_face_size=None):
+        self.detector = detector
+        self.name = detector.name
+        self.needs_color = detector.needs_color
+        self.detect_size = detect_size
+        self.min_face_size = min_face_size
+        self.max_face_size = max_face_size
+
+    def detect(self, image, min_size=None, max_size=None):
+        min_size = min_size or self.min_face_size
+        max_size = max_size or self.max_face_size
+        h, w = image.shape[:2]
+        scale = 1.0
+        if self.detect_size and max(h, w) > self.detect_size:
+            scale = self.detect_size / max(h, w)
+        if scale == 1.0:
+            return self.detector.detect(image, min_size, max_size)
+
+        small = cv2.resize(image, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+        sx, sy = w / small.shape[1], h / small.shape[0]
+        boxes = self.detector.detect(
+            small,
+            min_size=max(1, round(min_size * scale)) if min_size else None,
+            max_size=round(max_size * scale) if max_size else None,
+        )
+        return _clip_boxes([(x * sx, y * sy, bw * sx, bh * sy) for x, y, bw, bh in boxes], image.shape)
+
+
+BACKENDS = {cls.name: cls for cls in (HaarDetector, LBPDetector, SSDDetector, YuNetDetector)}
+
+
+def create_detector(backend='haar', detect_size=None, min_face_size=None, max_face_size=None, **params):
+    """Create a face detector by backend name with backend-specific parameters.
+
+    `detect_size`, `min_face_size` and `max_face_size` work with every backend;
+    see DownscaledDetector.
+    """
+    try:
+        cls = BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown face detector backend '{backend}'. Choose from: {', '.join(BACKENDS)}")
+    detector = cls(**params)
+    if detect_size or min_face_size or max_face_size:
+        detector = DownscaledDetector(detector, detect_size, min_face_size, max_face_size)
+    return detector
+
+
+def parse_options(pairs):
+    """Parse ['key=value', ...] command-line options into detector parameters."""
+    options = {}
+    for pair in pairs or []:
+        key, _, value = pair.partition('=')
+        for cast in (int, float):
+            try:
+                value = cast(value)
+                break
+            except ValueError:
+                continue
+        options[key.replace('-', '_')] = value
+    return options
@@ -0,0 +1,84 @@
+"""Shared preprocessing of face crops for the emotion CNN.
+
+The live script, the batch CLI, the Django app and training all build model
+inputs through this module, so the same face always becomes the same tensor:
+
+    gray  = to_gray(frame)                 # one cvtColor per frame, not per face
+    crops = preprocessor.crop(gray, boxes) # uint8 (N, 48, 48), resized in place
+    batch = preprocessor.normalize(crops)  # float32 (N, 48, 48, 1) in [0, 1]
+
+FacePreprocessor keeps its uint8 crop buffer and float32 batch buffer between
+calls and only grows them, so steady-state preprocessing allocates nothing per
+face. Arrays it returns are views into those buffers and stay valid until the
+next call on the same instance; use one instance per thread.
+
+Normalization divides by 255 in float32 (`normalize`), which is exactly what
+`train_emotion_model.py` does for its training data.
+"""
+import cv2
+import numpy as np
+
+FACE_SIZE = (48, 48)
+
+
+def to_gray(image):
+    """Return a 2-D uint8 grayscale view or copy of a BGR, BGRA or grayscale image."""
+    if image.ndim == 3:
+        channels = image.shape[2]
+        if channels == 3:
+            return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if channels == 4:
+            return cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
+        return image[:, :, 0]
+    return image
+
+
+def normalize(images, out=None):
+    """Scale (..., 48, 48) pixel values to float32 [0, 1] and add a channel axis.
+
+    Equivalent to `images.astype('float32')[..., None] / 255.0`, in one pass.
+    """
+    images = np.asarray(images)
+    if images.ndim >= 1 and images.shape[-1] == 1:
+        images = images[..., 0]
+    if out is None:
+        out = np.empty(images.shape + (1,), dtype=np.float32)
+    np.divide(images, np.float32(255.0), out=out[..., 0], dtype=np.float32)
+    return out
+
+
+def preprocess_face(face):
+    """Preprocess a single face crop (any size, BGR or grayscale) into a (48, 48, 1) array."""
+    return normalize(cv2.resize(to_gray(face), FACE_SIZE))
+
+
+class FacePreprocessor:
+    """Crop, resize and normalize face boxes into reusable buffers."""
+
+    def __init__(self, capacity=16):
+        self._crops = np.empty((capacity,) + FACE_SIZE, dtype=np.uint8)
+        self._batch = np.empty((capacity,) + FACE_SIZE + (1,), dtype=np.float32)
+
+    def _reserve(self, n):
+        if n > len(self._crops):
+            capacity = max(n, 2 * len(self._crops))
+            self._crops = np.empty((capacity,) + FACE_SIZE, dtype=np.uint8)
+            self._batch = np.empty((capacity,) + FACE_SIZE + (1,), dtype=np.float32)
+
+    def crop(self, gray, boxes):
+        """Resize each (x, y, w, h) box of a grayscale image into a uint8 (N, 48, 48) view."""
+        boxes = list(boxes)
+        self._reserve(len(boxes))
+        crops = self._crops[:len(boxes)]
+        for i, (x, y, w, h) in enumerate(boxes):
+            cv2.resize(gray[y:y+h, x:x+w], FACE_SIZE, dst=crops[i])
+        return crops
+
+    def normalize(self, crops):
+        """Normalize uint8 (N, 48, 48) crops into a float32 (N, 48, 48, 1) view."""
+        self._reserve(len(crops))
+        return normalize(crops, out=self._batch[:len(crops)])
+
+    def __call__(self, image, boxes):
+        """Crop and normalize every face box of `image` (BGR, BGRA or grayscale)."""
+        return self.normalize(self.crop(to_gray(image), boxes))
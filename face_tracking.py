@@ -0,0 +1,175 @@
+"""Track faces between detections so the detector doesn't run on every frame.
+
+FaceTracker runs the full face detector every `detect_every` frames, or as soon
+as any track loses confidence, and carries boxes forward with a cheap
+per-face tracker in between. Detections are matched to existing tracks by IoU,
+so each face keeps a stable track ID for as long as it stays in view.
+
+Tracker types:
+- 'flow': Lucas-Kanade optical flow on corner features inside the box
+  (works with the plain opencv-python package)
+- 'kcf', 'csrt', 'mosse': OpenCV tracking API (needs opencv-contrib-python)
+"""
+import itertools
+import cv2
+import numpy as np
+
+
+def box_iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes."""
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    inter = max(0, x1 - x0) * max(0, y1 - y0)
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union else 0.0
+
+
+class FlowTracker:
+    """Follow a box with the median optical-flow shift of features inside it."""
+
+    def __init__(self, max_corners=30, min_points=5, min_inlier_ratio=0.5):
+        self.max_corners = max_corners
+        self.min_points = min_points
+        self.min_inlier_ratio = min_inlier_ratio
+        self._points = None
+        self._prev_gray = None
+        self._box = None
+
+    def init(self, frame, gray, box):
+        x, y, w, h = box
+        mask = np.zeros_like(gray)
+        mask[y:y+h, x:x+w] = 255
+        self._points = cv2.goodFeaturesToTrack(gray, self.max_corners, 0.01, 3, mask=mask)
+        self._prev_gray = gray
+        self._box = box
+
+    def update(self, frame, gray):
+        """Return (confidence, box); confidence 0 means the track is lost."""
+        if self._points is None or len(self._points) < self.min_points:
+            return 0.0, self._box
+        points, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, self._points, None)
+        good = status.reshape(-1) == 1
+        confidence = float(good.mean())
+        if good.sum() < self.min_points or confidence < self.min_inlier_ratio:
+            return 0.0, self._box
+
+        dx, dy = np.median((points[good] - self._points[good]).reshape(-1, 2), axis=0)
+        x, y, w, h = self._box
+        h_img, w_img = gray.shape[:2]
+        x = int(np.clip(round(x + dx), 0, max(w_img - w, 0)))
+        y = int(np.clip(round(y + dy), 0, max(h_img - h, 0)))
+        self._box = (x, y, w, h)
+        self._points = points[good].reshape(-1, 1, 2)
+        self._prev_gray = gray
+        return confidence, self._box
+
+
+class OpenCVTracker:
+    """Adapter for the OpenCV tracking API (KCF, CSRT, MOSSE)."""
+
+    factories = {'kcf': 'TrackerKCF_create', 'csrt': 'TrackerCSRT_create', 'mosse': 'TrackerMOSSE_create'}
+
+    def __init__(self, kind):
+        name = self.factories[kind]
+        for module in (cv2, getattr(cv2, 'legacy', None)):
+            if module is not None and hasattr(module, name):
+                self._create = getattr(module, name)
+                break
+        else:
+            raise ValueError(f"OpenCV tracker '{kind}' is not available; install opencv-contrib-python or use 'flow'")
+        self._tracker = None
+
+    def init(self, frame, gray, box):
+        self._tracker = self._create()
+        self._tracker.init(frame, tuple(int(v) for v in box))
+
+    def update(self, frame, gray):
+        """Return (confidence, box); confidence 0 means the track is lost."""
+        ok, box = self._tracker.update(frame)
+        if not ok:
+            return 0.0, None
+        # These trackers can drift partly or wholly outside the frame; clip the
+        # box so crops stay valid, and drop it if nothing of it is left
+        x, y, w, h = (int(v) for v in box)
+        h_img, w_img = gray.shape[:2]
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, w_img), min(y + h, h_img)
+        if x1 <= x0 or y1 <= y0:
+            return 0.0, None
+        return 1.0, (x0, y0, x1 - x0, y1 - y0)
+
+
+TRACKERS = ('flow', 'kcf', 'csrt', 'mosse')
+
+
+def create_tracker(kind='flow'):
+    if kind == 'flow':
+        return FlowTracker()
+    if kind in OpenCVTracker.factories:
+        return OpenCVTracker(kind)
+    raise ValueError(f"Unknown tracker '{kind}'. Choose from: {', '.join(TRACKERS)}")
+
+
+class Track:
+    """A face followed across frames under a stable ID."""
+
+    def __init__(self, track_id, box, tracker):
+        self.id = track_id
+        self.box = box
+        self.tracker = tracker
+        self.confidence = 1.0
+        self.age = 0
+
+
+class FaceTracker:
+    """Detect faces every N frames and track them in between."""
+
+    def __init__(self, face_detector, detect_every=5, tracker='flow', min_confidence=0.5, iou_threshold=0.3):
+        self.face_detector = face_detector
+        self.detect_every = max(1, int(detect_every))
+        self.tracker_kind = tracker
+        self.min_confidence = min_confidence
+        self.iou_threshold = iou_threshold
+        self.tracks = []
+        self._frame_index = 0
+        self._ids = itertools.count(1)
+        create_tracker(tracker)  # fail early if the tracker type isn't available
+
+    def update(self, frame, gray):
+        """Advance one frame and return the current list of Track objects."""
+        need_detection = self._frame_index % self.detect_every == 0 or not self.tracks
+        self._frame_index += 1
+
+        if not need_detection:
+            for track in self.tracks:
+                confidence, box = track.tracker.update(frame, gray)
+                track.confidence = confidence
+                track.age += 1
+                if box is not None:
+                    track.box = box
+            need_detection = any(t.confidence < self.min_confidence for t in self.tracks)
+            if not need_detection:
+                return self.tracks
+
+        faces = self.face_detector.detect(frame if self.face_detector.needs_color else gray)
+        self._frame_index = 1
+        self.tracks = self._match(frame, gray, faces)
+        return self.tracks
+
+    def _match(self, frame, gray, faces):
+        """Assign detections to existing tracks by IoU; unmatched faces get new IDs."""
+        unmatched = list(self.tracks)
+        tracks = []
+        for box in faces:
+            box = tuple(int(v) for v in box)
+            scores = [box_iou(box, t.box) for t in unmatched]
+            if scores and max(scores) >= self.iou_threshold:
+                track = unmatched.pop(int(np.argmax(scores)))
+                track.box = box
+            else:
+                track = Track(next(self._ids), box, create_tracker(self.tracker_kind))
+            track.tracker.init(frame, gray, box)
+            track.confidence = 1.0
+            track.age = 0
+            tracks.append(track)
+        return tracks
@@ -0,0 +1,206 @@
+"""Inference backends for the emotion CNN.
+
+All backends expose `predict(batch, verbose=0)` on a float32 (N, 48, 48, 1)
+batch and return an (N, 7) numpy array, so they are drop-in replacements for a
+Keras model wherever the code calls `model.predict`.
+
+    model = load_model('emotion_model.h5')      # full TensorFlow / Keras
+    model = load_model('emotion_model.tflite')  # tflite-runtime (or tf.lite)
+    model = load_model('emotion_model.onnx')    # onnxruntime
+
+The TFLite and ONNX backends do not import TensorFlow when their lightweight
+runtimes (`tflite-runtime`, `onnxruntime`) are installed, which keeps startup
+time and memory low. Create the artifacts with `export_model.py`.
+"""
+import os
+import threading
+import numpy as np
+
+
+class KerasBackend:
+    """Full tf.keras model, called through pre-traced tf.functions.
+
+    `model.predict` builds a data adapter and runs the predict loop on every
+    call, which costs milliseconds for this small CNN. Instead, a tf.function
+    is traced once per batch-size bucket with a fixed input signature, and each
+    batch is zero-padded up to the nearest bucket and called directly. Batches
+    larger than the biggest bucket are split into chunks.
+    """
+
+    name = 'keras'
+
+    def __init__(self, model_path, buckets=(1, 4, 16, 64)):
+        import tensorflow as tf
+        self._tf = tf
+        self.model = tf.keras.models.load_model(model_path)
+        self.buckets = tuple(sorted(buckets))
+        self._input_shape = tuple(self.model.input_shape[1:])
+        self._num_classes = self.model.output_shape[-1]
+
+        call = tf.function(lambda x: self.model(x, training=False))
+        self._functions = {
+            n: call.get_concrete_function(tf.TensorSpec((n, *self._input_shape), tf.float32))
+            for n in self.buckets
+        }
+
+    def predict(self, batch, verbose=0):
+        batch = np.asarray(batch, dtype=np.float32)
+        n = len(batch)
+        if n == 0:
+            return np.empty((0, self._num_classes), dtype=np.float32)
+        largest = self.buckets[-1]
+        if n > largest:
+            return np.concatenate([self.predict(batch[i:i+largest]) for i in range(0, n, largest)])
+
+        bucket = next(b for b in self.buckets if b >= n)
+        if bucket != n:
+            padded = np.zeros((bucket, *self._input_shape), dtype=np.float32)
+            padded[:n] = batch
+            batch = padded
+        return self._functions[bucket](self._tf.constant(batch)).numpy()[:n]
+
+    def warmup(self):
+        """Run every traced bucket once so the first real call is fast."""
+        for n in self.buckets:
+            self.predict(np.zeros((n, *self._input_shape), dtype=np.float32))
+
+
+class TFLiteBackend:
+    """TensorFlow Lite interpreter, using tflite-runtime when available.
+
+    Resizing the input and re-allocating tensors on every change of batch size
+    is expensive, so like KerasBackend each batch is zero-padded up to the
+    nearest batch-size bucket. Every bucket gets its own interpreter, created
+    and allocated the first time the bucket is used; batches larger than the
+    biggest bucket are split into chunks.
+
+    Interpreters are not thread-safe, so calls to predict() are serialized.
+    Full-integer (int8/uint8 input and output) models are supported: float
+    inputs are quantized and outputs dequantized with the model's parameters.
+    """
+
+    name = 'tflite'
+
+    def __init__(self, model_path, num_threads=None, buckets=(1, 4, 16, 64)):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        self._Interpreter = Interpreter
+        self._model_path = model_path
+        self._num_threads = num_threads
+        self.buckets = tuple(sorted(buckets))
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self._input_shape = tuple(int(d) for d in self.interpreter.get_input_details()[0]['shape'][1:])
+        self._num_classes = int(self.interpreter.get_output_details()[0]['shape'][-1])
+        self._interpreters = {}
+        self._lock = threading.Lock()
+
+    def _for_bucket(self, bucket):
+        """Return (interpreter, input details, output details) sized for `bucket`."""
+        entry = self._interpreters.get(bucket)
+        if entry is None:
+            if self._interpreters:
+                interpreter = self._Interpreter(model_path=self._model_path, num_threads=self._num_threads)
+            else:
+                interpreter = self.interpreter  # reuse the one opened in __init__
+            index = interpreter.get_input_details()[0]['index']
+            interpreter.resize_tensor_input(index, [bucket, *self._input_shape])
+            interpreter.allocate_tensors()
+            entry = (interpreter, interpreter.get_input_details()[0], interpreter.get_output_details()[0])
+            self._interpreters[bucket] = entry
+        return entry
+
+    def predict(self, batch, verbose=0):
+        batch = np.asarray(batch, dtype=np.float32)
+        n = len(batch)
+        if n == 0:
+            return np.empty((0, self._num_classes), dtype=np.float32)
+        largest = self.buckets[-1]
+        if n > largest:
+            return np.concatenate([self.predict(batch[i:i+largest]) for i in range(0, n, largest)])
+
+        bucket = next(b for b in self.buckets if b >= n)
+        if bucket != n:
+            padded = np.zeros((bucket, *self._input_shape), dtype=np.float32)
+            padded[:n] = batch
+            batch = padded
+        with self._lock:
+            return self._invoke(bucket, batch)[:n]
+
+    def _invoke(self, bucket, batch):
+        interpreter, input_details, output_details = self._for_bucket(bucket)
+        interpreter.set_tensor(input_details['index'], _quantize(batch, input_details))
+        interpreter.invoke()
+        return _dequantize(interpreter.get_tensor(output_details['index']), output_details)
+
+    def warmup(self):
+        """Allocate and run every bucket once so the first real call is fast."""
+        for n in self.buckets:
+            self.predict(np.zeros((n, *self._input_shape), dtype=np.float32))
+
+
+def _quantize(x, details):
+    dtype = details['dtype']
+    if dtype == np.float32:
+        return x
+    scale, zero_point = details['quantization']
+    info = np.iinfo(dtype)
+    return np.clip(np.round(x / scale + zero_point), info.min, info.max).astype(dtype)
+
+
+def _dequantize(x, details):
+    if details['dtype'] == np.float32:
+        return x.copy()
+    scale, zero_point = details['quantization']
+    return (x.astype(np.float32) - zero_point) * scale
+
+
+class ONNXBackend:
+    """ONNX Runtime CPU session."""
+
+    name = 'onnx'
+
+    def __init__(self, model_path, num_threads=None):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self._input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch, verbose=0):
+        batch = np.asarray(batch, dtype=np.float32)
+        return self.session.run(None, {self._input_name: batch})[0]
+
+    def warmup(self):
+        shape = [d if isinstance(d, int) else 1 for d in self.session.get_inputs()[0].shape]
+        self.predict(np.zeros(shape, dtype=np.float32))
+
+
+BACKENDS = {cls.name: cls for cls in (KerasBackend, TFLiteBackend, ONNXBackend)}
+
+EXTENSIONS = {'.h5': 'keras', '.keras': 'keras', '.tflite': 'tflite', '.onnx': 'onnx'}
+
+
+def load_model(model_path, backend=None, warmup=False, **options):
+    """Load `model_path` with `backend`, inferred from the file extension if not given.
+
+    With `warmup=True` the model runs once on dummy inputs before it is
+    returned, so the first real request doesn't pay for graph tracing or
+    tensor allocation.
+    """
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f'Model file not found at {model_path}')
+    if backend is None:
+        ext = os.path.splitext(model_path)[1].lower()
+        backend = EXTENSIONS.get(ext, 'keras')
+    try:
+        cls = BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown inference backend '{backend}'. Choose from: {', '.join(BACKENDS)}")
+    model = cls(model_path, **options)
+    if warmup:
+        model.warmup()
+    return model
@@ -2,82 +2,433 @@
 
 Usage:
     python live_emotion_detection.py --model emotion_model.h5
+    python live_emotion_detection.py --model emotion_model.tflite
+    python live_emotion_detection.py --pipeline
+    python live_emotion_detection.py --track-every 5 --tracker flow
+    python live_emotion_detection.py --track-every 5 --smooth --reclassify-every 10
+    python live_emotion_detection.py --detector yunet --detector-option model_path=face_detection_yunet_2023mar.onnx
 
-Requires `haarcascade_frontalface_default.xml` available in the working directory or OpenCV data.
+The default Haar backend requires `haarcascade_frontalface_default.xml` available in the
+working directory or OpenCV data. See `face_detectors.py` for the other backends.
 """
 import argparse
+import queue
+import threading
+import time
+from collections import deque
 import cv2
 import numpy as np
-import tensorflow as tf
-from utils import preprocess_image
+from face_preprocessing import FacePreprocessor, preprocess_face
+from inference_backends import load_model
+from face_detectors import BACKENDS, create_detector, parse_options
+from face_tracking import TRACKERS, FaceTracker
+from emotion_smoothing import EmotionSmoother
+import metrics
 
 EMOTION_LABELS = ['Angry', 'Disgust', 'Fear', 'Happy', 'Sad', 'Surprise', 'Neutral']
 
+# Only ever used from the thread that runs inference
+_preprocessor = FacePreprocessor()
 
-def load_face_detector():
-    # Try common locations for the Haar cascade bundled with OpenCV
-    cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-    if not cv2.os.path.exists(cascade_path):
-        raise FileNotFoundError('Haar cascade XML not found in OpenCV data. Please provide haarcascade_frontalface_default.xml')
-    face_cascade = cv2.CascadeClassifier(cascade_path)
-    return face_cascade
+
+def load_face_detector(backend='haar', **options):
+    # Haar looks for the cascade bundled with OpenCV; DNN backends need their model files
+    return create_detector(backend, **options)
 
 
 def predict_on_frame(model, face_img):
     # face_img: BGR or grayscale image cropped to the face region
-    gray = cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY) if face_img.ndim == 3 else face_img
-    # resize to 48x48
-    gray = cv2.resize(gray, (48, 48))
-    proc = preprocess_image(gray)
-    proc = np.expand_dims(proc, 0)  # batch
+    proc = np.expand_dims(preprocess_face(face_img), 0)  # batch
     preds = model.predict(proc)
     idx = int(np.argmax(preds))
     prob = float(np.max(preds))
     return EMOTION_LABELS[idx], prob
 
 
-def main(model_path):
-    print('Loading model:', model_path)
-    model = tf.keras.models.load_model(model_path)
+def predict_on_faces(model, frame, faces):
+    """Classify every face in a frame with a single forward pass.
 
-    face_cascade = load_face_detector()
+    faces: iterable of (x, y, w, h) boxes. Returns a list of (label, prob)
+    tuples in the same order as the boxes.
+    """
+    faces = list(faces)
+    if not faces:
+        return []
+    with metrics.timed('preprocess'):
+        batch = _preprocessor(frame, faces)
+    with metrics.timed('predict'):
+        preds = model.predict(batch, verbose=0)
+    idxs = np.argmax(preds, axis=1)
+    return [(EMOTION_LABELS[int(i)], float(p[i])) for i, p in zip(idxs, preds)]
 
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
-        print('ERROR: Could not open webcam.')
-        return
 
-    print('Press q to quit.')
+def predict_smoothed(model, gray, faces, ids, smoother):
+    """Classify tracked faces through an EmotionSmoother.
+
+    Only faces whose crop changed (or that are due for re-classification) go
+    through the model; the others reuse their track's cached distribution.
+    """
+    crops = _preprocessor.crop(gray, faces)
+
+    def predict(indices):
+        with metrics.timed('preprocess'):
+            batch = _preprocessor.normalize(crops[indices])
+        with metrics.timed('predict'):
+            return model.predict(batch, verbose=0)
+
+    probs = smoother.classify(ids, crops, predict)
+    return [(EMOTION_LABELS[int(np.argmax(p))], float(np.max(p))) for p in probs]
+
+
+def process_frame(model, face_detector, frame, tracker=None, smoother=None, gray=None):
+    """Detect and classify the faces in a BGR frame.
+
+    With a FaceTracker, faces come from the tracker (full detection only every
+    N frames) and carry stable track IDs; with an EmotionSmoother as well,
+    predictions are smoothed per track and unchanged faces skip the model.
+    `gray` is the frame already converted to grayscale, if the caller has it
+    (see GrayRing).
+
+    Returns (faces, predictions, ids): a list of (x, y, w, h) boxes, a matching
+    list of (label, prob) tuples and a list of track IDs (None without a tracker).
+    """
+    if gray is None:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    with metrics.timed('detect'):
+        if tracker is None:
+            faces = face_detector.detect(frame if face_detector.needs_color else gray)
+            ids = None
+        else:
+            tracks = tracker.update(frame, gray)
+            faces = [t.box for t in tracks]
+            ids = [t.id for t in tracks]
+    metrics.FACES_PER_IMAGE.observe(len(faces))
+
+    try:
+        if smoother is not None and ids is not None:
+            predictions = predict_smoothed(model, gray, faces, ids, smoother)
+        else:
+            predictions = predict_on_faces(model, gray, faces)
+    except Exception:
+        predictions = [('Error', 0.0)] * len(faces)
+    return faces, predictions, ids
+
+
+def draw_results(frame, faces, predictions, ids=None):
+    for i, ((x, y, w, h), (label, prob)) in enumerate(zip(faces, predictions)):
+        # draw rectangle and label
+        cv2.rectangle(frame, (x, y), (x+w, y+h), (255, 0, 0), 2)
+        text = f'{label} ({prob*100:.1f}%)'
+        if ids is not None:
+            text = f'#{ids[i]} {text}'
+        cv2.putText(frame, text, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,255,0), 2)
+
+
+class StageStats:
+    """Rolling FPS and latency of one pipeline stage."""
+
+    def __init__(self, name, window=30):
+        self.name = name
+        self._times = deque(maxlen=window)
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency):
+        with self._lock:
+            self._times.append(time.perf_counter())
+            self._latencies.append(latency)
+
+    def summary(self):
+        with self._lock:
+            if len(self._times) < 2:
+                return 0.0, 0.0
+            fps = (len(self._times) - 1) / max(self._times[-1] - self._times[0], 1e-6)
+            return fps, 1000.0 * sum(self._latencies) / len(self._latencies)
+
+
+def draw_stats(frame, stats):
+    for i, stage in enumerate(stats):
+        fps, latency_ms = stage.summary()
+        text = f'{stage.name}: {fps:5.1f} fps {latency_ms:6.1f} ms'
+        cv2.putText(frame, text, (10, 20 + 20 * i), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1)
+
+
+def put_latest(q, item, on_drop=None):
+    """Put item on a bounded queue, dropping the oldest entry if it is full.
+
+    `on_drop` is called with every entry dropped this way.
+    """
+    while True:
+        try:
+            q.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                dropped = q.get_nowait()
+            except queue.Empty:
+                continue
+            if on_drop is not None:
+                on_drop(dropped)
+
+
+class FrameBuffer:
+    __slots__ = ('image', 'refs')
+
+    def __init__(self):
+        self.image = None
+        self.refs = 0
+
+
+class FramePool:
+    """Reusable BGR frame buffers filled in place by `cap.read(buffer)`.
+
+    Each frame handed out by `read()` carries a reference count (one per
+    consumer); it goes back to the pool when every consumer has called
+    `release()`. If all buffers are in use, a new one is added, so the pool
+    grows to what the pipeline actually holds and then stops allocating.
+    """
+
+    def __init__(self, size=2):
+        self._free = deque(FrameBuffer() for _ in range(size))
+        self._lock = threading.Lock()
+        self.size = size
+
+    def read(self, cap, refs=1):
+        """Read the next frame into a free buffer; returns (ret, FrameBuffer)."""
+        with self._lock:
+            if self._free:
+                buf = self._free.popleft()
+            else:
+                buf = FrameBuffer()
+                self.size += 1
+        ret, image = cap.read(buf.image)
+        if image is not None:
+            buf.image = image  # same array unless the resolution changed
+        buf.refs = refs
+        if not ret:
+            self.release(buf, buf.refs)
+        return ret, buf
+
+    def release(self, buf, count=1):
+        with self._lock:
+            buf.refs -= count
+            if buf.refs <= 0:
+                self._free.append(buf)
+
+
+class GrayRing:
+    """Round-robin grayscale buffers filled by `cvtColor(..., dst=...)`.
+
+    FlowTracker keeps the previous frame's grayscale image for optical flow,
+    so it must survive the next conversion: the ring needs at least 2 slots.
+    Use one ring per thread.
+    """
+
+    def __init__(self, size=2):
+        self._buffers = [None] * size
+        self._next = 0
+
+    def convert(self, frame):
+        i = self._next
+        self._next = (i + 1) % len(self._buffers)
+        self._buffers[i] = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._buffers[i])
+        return self._buffers[i]
+
+
+class MetricsReporter:
+    """Print a metrics summary to the console every `interval` seconds."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._next = time.monotonic() + interval
+
+    def maybe_report(self):
+        if self.interval and time.monotonic() >= self._next:
+            self._next = time.monotonic() + self.interval
+            print('Stage timings:')
+            print(metrics.summary())
+
+
+def run_sequential(model, face_detector, cap, tracker=None, smoother=None, reporter=None):
+    # One frame is live at a time, so the frame and grayscale buffers are reused every iteration
+    frames = FramePool(1)
+    grays = GrayRing(2)
     while True:
-        ret, frame = cap.read()
+        with metrics.timed('capture'):
+            ret, buf = frames.read(cap)
         if not ret:
             break
+        frame = buf.image
 
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray, scaleFactor=1.3, minNeighbors=5)
+        faces, predictions, ids = process_frame(model, face_detector, frame, tracker, smoother,
+                                                gray=grays.convert(frame))
+        with metrics.timed('render'):
+            draw_results(frame, faces, predictions, ids)
+            cv2.imshow('Emotion Detection', frame)
+        frames.release(buf)
+        if reporter is not None:
+            reporter.maybe_report()
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+
+
+def run_pipelined(model, face_detector, cap, tracker=None, smoother=None, reporter=None):
+    """Run capture, detection+inference and rendering as separate stages.
 
-        for (x, y, w, h) in faces:
-            face_img = frame[y:y+h, x:x+w]
+    The stages are connected by single-slot queues that drop stale frames, so
+    the preview runs at camera rate while inference runs at its own rate; the
+    newest available results are drawn on every displayed frame.
+
+    Frames are read into a FramePool shared by the display and inference
+    stages; a buffer is refilled only once both are done with it (or it was
+    dropped as stale), so steady-state capture allocates nothing.
+    """
+    stop = threading.Event()
+    frames = FramePool(5)  # two queued, two in use, one being captured
+    display_q = queue.Queue(maxsize=1)
+    inference_q = queue.Queue(maxsize=1)
+    capture_stats = StageStats('capture')
+    inference_stats = StageStats('inference')
+    render_stats = StageStats('render')
+    latest = {'faces': [], 'predictions': [], 'ids': None}
+    latest_lock = threading.Lock()
+    errors = []
+
+    def capture():
+        while not stop.is_set():
+            start = time.perf_counter()
+            ret, buf = frames.read(cap, refs=2)
+            if not ret:
+                stop.set()
+                break
+            capture_stats.record(time.perf_counter() - start)
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - start, 'capture')
+            put_latest(display_q, buf, frames.release)
+            put_latest(inference_q, buf, frames.release)
+
+    def infer():
+        grays = GrayRing(2)
+        while not stop.is_set():
             try:
-                label, prob = predict_on_frame(model, face_img)
-            except Exception:
-                label, prob = 'Error', 0.0
+                buf = inference_q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            start = time.perf_counter()
+            try:
+                faces, predictions, ids = process_frame(model, face_detector, buf.image, tracker, smoother,
+                                                        gray=grays.convert(buf.image))
+            except Exception as e:
+                # Don't die silently and leave the preview running with frozen
+                # boxes: stop the pipeline and re-raise on the main thread
+                errors.append(e)
+                stop.set()
+                break
+            finally:
+                frames.release(buf)
+            with latest_lock:
+                latest['faces'], latest['predictions'], latest['ids'] = faces, predictions, ids
+            inference_stats.record(time.perf_counter() - start)
 
-            # draw rectangle and label
-            cv2.rectangle(frame, (x, y), (x+w, y+h), (255, 0, 0), 2)
-            text = f'{label} ({prob*100:.1f}%)'
-            cv2.putText(frame, text, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,255,0), 2)
+    workers = [threading.Thread(target=capture, daemon=True), threading.Thread(target=infer, daemon=True)]
+    for t in workers:
+        t.start()
 
+    # cv2.imshow must stay on the main thread
+    frame = None
+    while not stop.is_set():
+        try:
+            buf = display_q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        start = time.perf_counter()
+        # Draw on a persistent copy: the inference stage may still be reading the original
+        if frame is None or frame.shape != buf.image.shape:
+            frame = np.empty_like(buf.image)
+        np.copyto(frame, buf.image)
+        frames.release(buf)
+        with latest_lock:
+            faces, predictions, ids = latest['faces'], latest['predictions'], latest['ids']
+        draw_results(frame, faces, predictions, ids)
+        draw_stats(frame, (capture_stats, inference_stats, render_stats))
         cv2.imshow('Emotion Detection', frame)
+        render_stats.record(time.perf_counter() - start)
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - start, 'render')
+        if reporter is not None:
+            reporter.maybe_report()
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
 
+    # Wait for both stages to exit before returning: the caller releases `cap`
+    # next, and the capture thread may still be inside cap.read(). Neither
+    # stage blocks for long (queue gets time out, puts never block), so this
+    # returns once the current read or inference step finishes.
+    stop.set()
+    for t in workers:
+        t.join()
+    if errors:
+        raise errors[0]
+
+
+def main(model_path, detector='haar', detector_options=None, pipeline=False, track_every=0, tracker='flow',
+         smoothing=None, metrics_interval=0):
+    reporter = None
+    if metrics_interval:
+        metrics.enable()
+        reporter = MetricsReporter(metrics_interval)
+
+    print('Loading model:', model_path)
+    start = time.perf_counter()
+    model = load_model(model_path, warmup=True)
+    metrics.MODEL_LOAD_SECONDS.set(time.perf_counter() - start)
+
+    face_detector = load_face_detector(detector, **(detector_options or {}))
+    face_tracker = FaceTracker(face_detector, detect_every=track_every, tracker=tracker) if track_every else None
+    smoother = EmotionSmoother(**smoothing) if face_tracker is not None and smoothing is not None else None
+
+    cap = cv2.VideoCapture(0)
+    if not cap.isOpened():
+        print('ERROR: Could not open webcam.')
+        return
+
+    print('Press q to quit.')
+    if pipeline:
+        run_pipelined(model, face_detector, cap, face_tracker, smoother, reporter)
+    else:
+        run_sequential(model, face_detector, cap, face_tracker, smoother, reporter)
+
+    if smoother is not None:
+        total = smoother.classified + smoother.skipped
+        print(f'Classified {smoother.classified} of {total} tracked faces ({smoother.skipped} reused from cache).')
+
     cap.release()
     cv2.destroyAllWindows()
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('--model', type=str, default='emotion_model.h5', help='Path to trained Keras .h5 model')
+    parser.add_argument('--model', type=str, default='emotion_model.h5', help='Path to trained model (.h5, .tflite or .onnx)')
+    parser.add_argument('--detector', type=str, default='haar', choices=sorted(BACKENDS), help='Face detector backend')
+    parser.add_argument('--detector-option', action='append', default=[], metavar='KEY=VALUE',
+                        help='Backend-specific detector parameter, e.g. min_neighbors=4 or model_path=...; repeatable')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Run capture, inference and rendering on separate threads with a per-stage FPS overlay')
+    parser.add_argument('--track-every', type=int, default=0, metavar='N',
+                        help='Run full face detection every N frames and track faces in between (0 = detect every frame)')
+    parser.add_argument('--tracker', type=str, default='flow', choices=TRACKERS, help='Tracker used between detections')
+    parser.add_argument('--smooth', action='store_true',
+                        help='With --track-every: smooth emotions per track and skip classifying unchanged faces')
+    parser.add_argument('--smooth-alpha', type=float, default=0.5, help='EMA weight of each new prediction')
+    parser.add_argument('--reclassify-every', type=int, default=10, help='Re-classify a tracked face at least every N frames')
+    parser.add_argument('--diff-threshold', type=float, default=6.0,
+                        help='Mean pixel difference of the face crop above which it is re-classified')
+    parser.add_argument('--max-idle', type=int, default=30, help='Forget a track after N frames without it')
+    parser.add_argument('--metrics-interval', type=float, default=0, metavar='SECONDS',
+                        help='Print per-stage timing metrics every N seconds (0 = off)')
     args = parser.parse_args()
-    main(args.model)
+    smoothing = None
+    if args.smooth:
+        smoothing = {'alpha': args.smooth_alpha, 'reclassify_every': args.reclassify_every,
+                     'diff_threshold': args.diff_threshold, 'max_idle': args.max_idle}
+    main(args.model, args.detector, parse_options(args.detector_option), pipeline=args.pipeline,
+         track_every=args.track_every, tracker=args.tracker, smoothing=smoothing,
+         metrics_interval=args.metrics_interval)
@@ -0,0 +1,175 @@
+"""Lightweight Prometheus-style metrics for the detection hot path.
+
+Shared by the Django app (exposed at /metrics) and live_emotion_detection.py
+(periodic console summary). Metrics are off until `enable()` is called; while
+disabled, `timed()` returns a shared no-op context manager and the other
+helpers return immediately, so instrumentation costs next to nothing.
+
+    with metrics.timed('detect'):
+        faces = detector.detect(image)
+    metrics.FACES_PER_IMAGE.observe(len(faces))
+"""
+import bisect
+import threading
+import time
+
+_enabled = False
+
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)] + [f'{n}="{v}"' for n, v in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by label values."""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, buckets=TIME_BUCKETS, labelnames=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        if not _enabled:
+            return
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self):
+        """Return {labels: (count, sum)}."""
+        with self._lock:
+            return {labels: (s[2], s[1]) for labels, s in self._series.items()}
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    le = _format_labels(self.labelnames, labels, [('le', bound)])
+                    lines.append(f'{self.name}_bucket{le} {cumulative}')
+                le = _format_labels(self.labelnames, labels, [('le', '+Inf')])
+                lines.append(f'{self.name}_bucket{le} {count}')
+                base = _format_labels(self.labelnames, labels)
+                lines.append(f'{self.name}_sum{base} {total}')
+                lines.append(f'{self.name}_count{base} {count}')
+        return lines
+
+
+class Gauge:
+    type = 'gauge'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        if _enabled:
+            self.value = value
+
+    def inc(self, amount=1):
+        if _enabled:
+            with self._lock:
+                self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def render(self):
+        return [f'{self.name} {self.value}']
+
+
+class Counter(Gauge):
+    type = 'counter'
+
+
+STAGE_SECONDS = Histogram('emotion_stage_seconds', 'Time spent per processing stage', labelnames=('stage',))
+FACES_PER_IMAGE = Histogram('emotion_faces_per_image', 'Faces detected per image', buckets=COUNT_BUCKETS)
+MODEL_LOAD_SECONDS = Gauge('emotion_model_load_seconds', 'Time taken to load the emotion model')
+REQUESTS_IN_FLIGHT = Gauge('emotion_requests_in_flight', 'Detection requests currently being processed')
+REQUESTS_TOTAL = Counter('emotion_requests_total', 'Detection requests processed')
+
+REGISTRY = [STAGE_SECONDS, FACES_PER_IMAGE, MODEL_LOAD_SECONDS, REQUESTS_IN_FLIGHT, REQUESTS_TOTAL]
+
+
+class _Timer:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        STAGE_SECONDS.observe(time.perf_counter() - self.start, self.stage)
+        return False
+
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopTimer()
+
+
+def timed(stage):
+    """Context manager recording the duration of `stage` in STAGE_SECONDS."""
+    return _Timer(stage) if _enabled else _NOOP
+
+
+def render():
+    """Return all metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def summary():
+    """One-line-per-stage console summary of mean stage latency."""
+    lines = []
+    for (stage,), (count, total) in sorted(STAGE_SECONDS.snapshot().items()):
+        lines.append(f'  {stage:<12} n={count:<7} mean={1000.0 * total / count:8.2f} ms')
+    for _, (count, total) in FACES_PER_IMAGE.snapshot().items():
+        lines.append(f'  {"faces/image":<12} n={count:<7} mean={total / count:8.2f}')
+    return '\n'.join(lines)
@@ -0,0 +1,50 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dataset_cache  # noqa: E402
+
+try:
+    import tensorflow as tf
+except ImportError:
+    tf = None
+
+
+class CompiledSplitTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        rng = np.random.default_rng(0)
+        self.images = rng.integers(0, 256, (10, 48, 48), dtype=np.uint8)
+        self.labels = np.arange(10) % 7
+        dataset_cache.write_compiled(self.images, self.labels, self.tmp.name, 'train', list('abcdefg'),
+                                     fingerprint='fp', source='test', shard_size=4)
+
+    def test_gather_across_shards(self):
+        split = dataset_cache.load_compiled(self.tmp.name, 'train', fingerprint='fp')
+        images, labels = split.gather(np.array([0, 3, 4, 9]))
+        np.testing.assert_array_equal(images, self.images[[0, 3, 4, 9]])
+        np.testing.assert_array_equal(labels, self.labels[[0, 3, 4, 9]])
+
+    def test_stale_fingerprint(self):
+        self.assertIsNone(dataset_cache.load_compiled(self.tmp.name, 'train', fingerprint='other'))
+
+    @unittest.skipIf(tf is None, 'TensorFlow is not installed')
+    def test_dataset_has_fully_ranked_shapes(self):
+        split = dataset_cache.load_compiled(self.tmp.name, 'train', fingerprint='fp')
+        ds = split.to_dataset(batch_size=4, shuffle=True)
+        images_spec, labels_spec = ds.element_spec
+        self.assertEqual(images_spec.shape.as_list(), [None, 48, 48, 1])
+        self.assertEqual(labels_spec.shape.as_list(), [None, 7])
+        images, labels = next(iter(ds))
+        self.assertEqual(images.dtype, tf.float32)
+        self.assertEqual(labels.shape[1], 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
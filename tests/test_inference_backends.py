@@ -0,0 +1,56 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import tensorflow as tf
+    import export_model
+    import train_emotion_model
+    from inference_backends import KerasBackend, TFLiteBackend
+except ImportError:
+    tf = None
+
+
+@unittest.skipIf(tf is None, 'TensorFlow is not installed')
+class TFLiteParityTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        tf.keras.utils.set_random_seed(0)
+        cls.model = train_emotion_model.build_model(arch='separable', width=0.25)
+        cls.model_path = os.path.join(cls.tmp.name, 'model.h5')
+        cls.model.save(cls.model_path)
+        cls.rng = np.random.default_rng(0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_float_tflite_matches_keras(self):
+        path = export_model.export_tflite(self.model, os.path.join(self.tmp.name, 'model.tflite'))
+        keras, tflite = KerasBackend(self.model_path), TFLiteBackend(path)
+        # 17 and 70 are padded to a bucket; 70 is also split across two chunks
+        for n in (1, 3, 17, 70):
+            batch = self.rng.random((n, 48, 48, 1), dtype=np.float32)
+            expected, actual = keras.predict(batch), tflite.predict(batch)
+            self.assertEqual(actual.shape, (n, 7))
+            self.assertTrue(np.allclose(expected, actual, atol=1e-5), f'batch size {n}')
+
+    def test_int8_tflite_round_trips(self):
+        calibration = self.rng.random((32, 48, 48, 1), dtype=np.float32)
+        path = train_emotion_model.quantize_int8(self.model, calibration,
+                                                 os.path.join(self.tmp.name, 'model_int8.tflite'))
+        tflite = TFLiteBackend(path)
+        batch = self.rng.random((5, 48, 48, 1), dtype=np.float32)
+        actual = tflite.predict(batch)
+        self.assertEqual(actual.dtype, np.float32)
+        self.assertTrue(np.allclose(self.model.predict(batch, verbose=0), actual, atol=0.01))
+
+
+if __name__ == '__main__':
+    unittest.main()
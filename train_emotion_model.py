@@ -3,37 +3,76 @@
 This script runs locally or on Colab. It downloads FER-2013 via tensorflow_datasets,
 preprocesses images to grayscale 48x48, builds a CNN, trains with validation,
 plots metrics and confusion matrix, and saves the model.
+
+Post-training int8 quantization of a trained model:
+    python train_emotion_model.py --quantize --model emotion_model.h5
+
+Decode the dataset once into memory-mapped shards that later runs train from:
+    python train_emotion_model.py --compile_dataset
+
+Lighter architectures, and a search over them against a CPU latency budget:
+    python train_emotion_model.py --arch separable --width 0.5
+    python train_emotion_model.py --latency_budget_ms 2 --epochs 10 --min_accuracy 0.6
+
+Distill the trained model into a smaller student (separable, width 0.5 by default):
+    python train_emotion_model.py --distill --teacher emotion_model.h5 --temperature 4 --alpha 0.1
 """
 import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import tensorflow as tf
 import os
 import tensorflow_datasets as tfds
 from tensorflow.keras import layers, models
-from tensorflow.keras.utils import to_categorical
 from sklearn.metrics import classification_report
 from utils import plot_history, plot_confusion_matrix
+from face_preprocessing import normalize
+import dataset_cache
 from tensorflow.keras.preprocessing import image
 
 
 
 EMOTION_LABELS = ['Angry', 'Disgust', 'Fear', 'Happy', 'Sad', 'Surprise', 'Neutral']
 
+AUTOTUNE = tf.data.AUTOTUNE
+
 
 def load_fer2013(split='train'):
     """Load the FER-2013 dataset via tensorflow_datasets and return numpy arrays."""
-    ds, info = tfds.load('fer2013', split=split, with_info=True, as_supervised=True)
-    images = []
-    labels = []
-    for img, label in tfds.as_numpy(ds):
-        # img is (48,48,1) uint8
-        images.append(img)
-        labels.append(label)
-    images = np.array(images)
-    labels = np.array(labels)
+    # batch_size=-1 returns the whole split as one (n,48,48,1) uint8 tensor
+    images, labels = tfds.as_numpy(tfds.load('fer2013', split=split, as_supervised=True, batch_size=-1))
     return images, labels
 
 
+def normalize_batch(images, labels):
+    # float32 division by 255 like face_preprocessing.normalize, plus one-hot labels
+    return tf.cast(images, tf.float32) / 255.0, tf.one_hot(labels, len(EMOTION_LABELS))
+
+
+def load_fer2013_datasets(batch_size=64, cache_dir='cache', shuffle_buffer=10000):
+    """Stream FER-2013 from tensorflow_datasets as batched tf.data pipelines.
+
+    Returns (train_ds, val_ds) in the same form as load_from_local_dirs: float32
+    images in [0,1] with shape (n,48,48,1) and one-hot labels. The decoded
+    uint8 examples are cached to files in `cache_dir` during the first epoch,
+    so later epochs read them back instead of going through TFDS again.
+    Normalization and one-hot encoding run per batch in parallel map calls,
+    and batches are prefetched while the model trains.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    datasets = []
+    for split, shuffle in (('train', True), ('validation', False)):
+        ds = tfds.load('fer2013', split=split, as_supervised=True)
+        ds = ds.cache(os.path.join(cache_dir, f'fer2013_{split}'))
+        if shuffle:
+            ds = ds.shuffle(shuffle_buffer, reshuffle_each_iteration=True)
+        ds = ds.batch(batch_size).map(normalize_batch, num_parallel_calls=AUTOTUNE).prefetch(AUTOTUNE)
+        datasets.append(ds)
+    return tuple(datasets)
+
+
 def load_from_local_dirs(train_dir='train', val_dir='test', image_size=(48, 48), batch_size=64):
     """Load datasets from local folders using Keras utilities.
 
@@ -66,131 +105,569 @@ def load_from_local_dirs(train_dir='train', val_dir='test', image_size=(48, 48),
         shuffle=False,
     )
 
-    # normalize to [0,1]
-    normalization = tf.keras.layers.Rescaling(1.0/255)
-    train_ds = train_ds.map(lambda x, y: (normalization(x), y))
-    val_ds = val_ds.map(lambda x, y: (normalization(x), y))
+    # normalize to [0,1]; a float32 division by 255 like face_preprocessing.normalize
+    # (Rescaling(1/255) multiplies, which differs from inference in the last bit)
+    train_ds = train_ds.map(lambda x, y: (x / 255.0, y), num_parallel_calls=AUTOTUNE).prefetch(AUTOTUNE)
+    val_ds = val_ds.map(lambda x, y: (x / 255.0, y), num_parallel_calls=AUTOTUNE).prefetch(AUTOTUNE)
 
     return train_ds, val_ds
 
 
+def compile_datasets(cache_dir, train_dir='train', val_dir='test'):
+    """Decode the training data once into memory-mapped shards under `cache_dir`.
+
+    Uses the local folders if present, else FER-2013 via TFDS, like main().
+    """
+    start = time.perf_counter()
+    if os.path.isdir(train_dir) and os.path.isdir(val_dir):
+        for name, src in (('train', train_dir), ('val', val_dir)):
+            index = dataset_cache.compile_directory(src, cache_dir, name)
+            print(f'Compiled {index["count"]} images from {src}/ into {cache_dir}')
+    else:
+        for name, split in (('train', 'train'), ('val', 'validation')):
+            images, labels = load_fer2013(split)
+            dataset_cache.write_compiled(images, labels, cache_dir, name, EMOTION_LABELS,
+                                         fingerprint=f'tfds:fer2013:{split}', source='tfds:fer2013')
+            print(f'Compiled {len(images)} FER-2013 {split} images into {cache_dir}')
+    print(f'Done in {time.perf_counter() - start:.1f}s')
+
+
+def load_compiled_datasets(cache_dir, batch_size=64, train_dir='train', val_dir='test'):
+    """Return (train_ds, val_ds) read from compiled shards, or (None, None) if there are none.
+
+    A compiled copy of a local folder that no longer matches the folder's
+    files is rebuilt first.
+    """
+    local = os.path.isdir(train_dir) and os.path.isdir(val_dir)
+    splits = []
+    for name, src, split in (('train', train_dir, 'train'), ('val', val_dir, 'validation')):
+        if not os.path.exists(os.path.join(cache_dir, f'{name}.index.json')):
+            return None, None
+        if local:
+            compiled = dataset_cache.load_compiled_directory(src, cache_dir, name)
+            if compiled is None:
+                print(f'Compiled copy of {src}/ is out of date; recompiling...')
+                dataset_cache.compile_directory(src, cache_dir, name)
+                compiled = dataset_cache.load_compiled_directory(src, cache_dir, name)
+        else:
+            compiled = dataset_cache.load_compiled(cache_dir, name, fingerprint=f'tfds:fer2013:{split}')
+            if compiled is None:
+                return None, None
+        splits.append(compiled)
+    train, val = splits
+    print(f'Using compiled dataset in {cache_dir}: {len(train)} train / {len(val)} validation images')
+    return train.to_dataset(batch_size, shuffle=True), val.to_dataset(batch_size)
+
+
 def preprocess(images):
-    images = images.astype('float32') / 255.0
-    # ensure shape (n,48,48,1)
-    if images.ndim == 3:
-        images = np.expand_dims(images, -1)
-    return images
+    # float32 (n,48,48,1) in [0,1], identical to the inference-time inputs
+    return normalize(images)
+
+
+class ThroughputCallback(tf.keras.callbacks.Callback):
+    """Report training throughput in images/sec at the end of every epoch.
+
+    Only the training steps are timed; validation is excluded.
+    """
 
+    def __init__(self, batch_size):
+        super().__init__()
+        self.batch_size = batch_size
+        self.history = []
 
-def build_model(input_shape=(48, 48, 1), num_classes=7):
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = time.perf_counter()
+        self._last = self._start
+        self._batches = 0
+
+    def on_train_batch_end(self, batch, logs=None):
+        self._batches += 1
+        self._last = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = self._last - self._start
+        # The last batch of an epoch may be partial, so this slightly overestimates
+        rate = self._batches * self.batch_size / elapsed if elapsed > 0 else 0.0
+        self.history.append(rate)
+        print(f' - {rate:.0f} images/sec')
+
+
+def collect_predictions(model, ds, workers=1):
+    """Run `model` over a batched (images, one-hot labels) dataset in a single pass.
+
+    Returns (y_true, probs): class indices and the (n, num_classes) model
+    outputs, in dataset order. With workers > 1, batches are dispatched to a
+    thread pool so several forward passes run at once; TensorFlow releases the
+    GIL, so this uses more cores when one batch alone can't keep them busy.
+    """
+    predict = tf.function(lambda x: model(x, training=False), reduce_retracing=True)
+    labels, outputs = [], []
+    if workers <= 1:
+        for x_batch, y_batch in ds:
+            outputs.append(predict(x_batch).numpy())
+            labels.append(np.argmax(y_batch.numpy(), axis=1))
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for x_batch, y_batch in ds:
+                pending.append(pool.submit(lambda x: predict(x).numpy(), x_batch))
+                labels.append(np.argmax(y_batch.numpy(), axis=1))
+                if len(pending) >= 2 * workers:  # bound the batches held in memory
+                    outputs.append(pending.popleft().result())
+            outputs.extend(f.result() for f in pending)
+    if not outputs:
+        return np.empty(0, dtype=np.int64), np.empty((0, len(EMOTION_LABELS)), dtype=np.float32)
+    return np.concatenate(labels), np.concatenate(outputs)
+
+
+def categorical_crossentropy(y_true, probs, epsilon=1e-7):
+    """Mean cross-entropy of softmax outputs, computed the way Keras does."""
+    probs = probs / probs.sum(axis=1, keepdims=True)
+    probs = np.clip(probs, epsilon, 1.0 - epsilon)
+    return float(-np.mean(np.log(probs[np.arange(len(y_true)), y_true])))
+
+
+def _scaled(filters, width):
+    return max(8, int(round(filters * width)))
+
+
+def _pooling_layer(pooling):
+    if pooling == 'gap':
+        return layers.GlobalAveragePooling2D()
+    if pooling == 'flatten':
+        return layers.Flatten()
+    raise ValueError(f"Unknown pooling '{pooling}'. Choose 'flatten' or 'gap'")
+
+
+def build_baseline(input_shape, num_classes, width=1.0, pooling='flatten'):
+    """The original Conv2D stack.
+
+    With pooling='gap', the Dense(128) layer sees 64 averaged channels instead
+    of the flattened 9x9x64 = 5184 features, which removes ~650k of its weights.
+    """
     model = models.Sequential()
-    model.add(layers.Conv2D(32, (3, 3), activation='relu', input_shape=input_shape))
-    model.add(layers.Conv2D(32, (3, 3), activation='relu'))
+    model.add(layers.Conv2D(_scaled(32, width), (3, 3), activation='relu', input_shape=input_shape))
+    model.add(layers.Conv2D(_scaled(32, width), (3, 3), activation='relu'))
     model.add(layers.MaxPooling2D((2, 2)))
     model.add(layers.Dropout(0.25))
 
-    model.add(layers.Conv2D(64, (3, 3), activation='relu'))
-    model.add(layers.Conv2D(64, (3, 3), activation='relu'))
+    model.add(layers.Conv2D(_scaled(64, width), (3, 3), activation='relu'))
+    model.add(layers.Conv2D(_scaled(64, width), (3, 3), activation='relu'))
     model.add(layers.MaxPooling2D((2, 2)))
     model.add(layers.Dropout(0.25))
 
-    model.add(layers.Flatten())
-    model.add(layers.Dense(128, activation='relu'))
+    model.add(_pooling_layer(pooling))
+    model.add(layers.Dense(_scaled(128, width), activation='relu'))
     model.add(layers.Dropout(0.5))
     model.add(layers.Dense(num_classes, activation='softmax'))
+    return model
+
+
+def _separable_block(x, filters, strides):
+    # MobileNet-style: 3x3 depthwise then 1x1 pointwise, each with BatchNorm + ReLU
+    x = layers.DepthwiseConv2D((3, 3), strides=strides, padding='same', use_bias=False)(x)
+    x = layers.BatchNormalization()(x)
+    x = layers.ReLU()(x)
+    x = layers.Conv2D(filters, (1, 1), use_bias=False)(x)
+    x = layers.BatchNormalization()(x)
+    return layers.ReLU()(x)
 
+
+def build_separable(input_shape, num_classes, width=1.0, pooling='gap'):
+    """Depthwise-separable (MobileNet-style) network, 48x48 -> 6x6 feature maps."""
+    inputs = layers.Input(shape=input_shape)
+    x = layers.Conv2D(_scaled(32, width), (3, 3), padding='same', use_bias=False)(inputs)
+    x = layers.BatchNormalization()(x)
+    x = layers.ReLU()(x)
+    for filters, strides in ((64, 1), (128, 2), (128, 1), (256, 2), (256, 1), (512, 2)):
+        x = _separable_block(x, _scaled(filters, width), strides)
+    x = _pooling_layer(pooling)(x)
+    x = layers.Dropout(0.3)(x)
+    outputs = layers.Dense(num_classes, activation='softmax')(x)
+    return models.Model(inputs, outputs)
+
+
+ARCHITECTURES = {
+    'baseline': (build_baseline, 'flatten'),
+    'separable': (build_separable, 'gap'),
+}
+
+
+def build_model(input_shape=(48, 48, 1), num_classes=7, arch='baseline', width=1.0, pooling=None):
+    """Build and compile a model.
+
+    arch: 'baseline' (the original Conv2D stack) or 'separable' (depthwise-separable).
+    width: multiplier applied to every layer's filter/unit count.
+    pooling: 'flatten' or 'gap' (global average pooling); defaults per architecture.
+    The defaults reproduce the original model.
+    """
+    try:
+        builder, default_pooling = ARCHITECTURES[arch]
+    except KeyError:
+        raise ValueError(f"Unknown architecture '{arch}'. Choose from: {', '.join(ARCHITECTURES)}")
+    model = builder(input_shape, num_classes, width=width, pooling=pooling or default_pooling)
     model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
     return model
 
 
-def main():
-    import argparse
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--epochs', type=int, default=30, help='Number of training epochs')
-    parser.add_argument('--batch_size', type=int, default=64, help='Batch size')
-    args = parser.parse_args()
-    epochs = args.epochs
-    batch_size = args.batch_size
+# Candidates compared by --latency_budget_ms: (arch, width, pooling)
+CANDIDATES = [
+    ('baseline', 1.0, 'flatten'),
+    ('baseline', 1.0, 'gap'),
+    ('baseline', 0.5, 'gap'),
+    ('separable', 1.0, 'gap'),
+    ('separable', 0.5, 'gap'),
+    ('separable', 0.25, 'gap'),
+]
 
-    os.makedirs('models', exist_ok=True)
 
-    # Prefer local directory datasets if present (train/ and test/)
-    print('Checking for local `train/` and `test/` directories...')
-    train_ds, val_ds = load_from_local_dirs(train_dir='train', val_dir='test', image_size=(48, 48), batch_size=batch_size)
+def measure_model_latency(model, batch_sizes=(1, 32), repeats=50):
+    """Median CPU latency in ms of a forward pass at each batch size."""
+    predict = tf.function(lambda x: model(x, training=False), reduce_retracing=True)
+    with tf.device('/CPU:0'):
+        return {n: measure_latency(predict, tf.zeros((n, 48, 48, 1)), repeats) for n in batch_sizes}
 
-    if train_ds is not None and val_ds is not None:
-        print('Found local dataset folders, using them for training.')
-        model = build_model(input_shape=(48, 48, 1), num_classes=7)
-        model.summary()
 
+def run_architecture_search(train_ds, val_ds, budget_ms, epochs, min_accuracy=None, eval_workers=1):
+    """Benchmark and train every candidate architecture and report accuracy vs. latency.
+
+    Candidates whose batch-1 CPU latency exceeds `budget_ms` are reported but
+    not trained. Each trained candidate is saved to models/<name>.h5.
+    """
+    rows = []
+    for arch, width, pooling in CANDIDATES:
+        name = f'{arch}_w{width:g}_{pooling}'
+        model = build_model(input_shape=(48, 48, 1), num_classes=7, arch=arch, width=width, pooling=pooling)
+        latency = measure_model_latency(model)
+        row = {'name': name, 'params': model.count_params(), 'ms1': latency[1], 'ms32': latency[32], 'acc': None}
+        rows.append(row)
+        print(f'{name}: {row["params"]:,} params, {row["ms1"]:.2f} ms @1, {row["ms32"]:.2f} ms @32')
+        if row['ms1'] > budget_ms:
+            print(f'  over the {budget_ms} ms budget; skipping training')
+            continue
+
+        path = os.path.join('models', name + '.h5')
         callbacks = [
-            tf.keras.callbacks.ModelCheckpoint('emotion_model.h5', monitor='val_accuracy', save_best_only=True),
+            tf.keras.callbacks.ModelCheckpoint(path, monitor='val_accuracy', save_best_only=True),
             tf.keras.callbacks.ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=3, min_lr=1e-6),
         ]
+        model.fit(train_ds, epochs=epochs, validation_data=val_ds, callbacks=callbacks, verbose=2)
+        best = tf.keras.models.load_model(path)
+        y_true, probs = collect_predictions(best, val_ds, workers=eval_workers)
+        row['acc'] = float(np.mean(np.argmax(probs, axis=1) == y_true))
+        row['path'] = path
+
+    print(f'\nCPU latency budget: {budget_ms} ms per face (batch 1)')
+    print(f"{'model':<24} {'params':>10} {'ms @1':>7} {'ms @32':>7} {'val acc':>8}")
+    for row in sorted(rows, key=lambda r: r['ms1']):
+        acc = f'{row["acc"]:.4f}' if row['acc'] is not None else 'skipped'
+        print(f'{row["name"]:<24} {row["params"]:>10,} {row["ms1"]:>7.2f} {row["ms32"]:>7.2f} {acc:>8}')
+
+    eligible = [r for r in rows if r['acc'] is not None and (min_accuracy is None or r['acc'] >= min_accuracy)]
+    if eligible:
+        choice = min(eligible, key=lambda r: r['ms1'])
+        print(f'Fastest model within budget{" meeting the accuracy bar" if min_accuracy else ""}: '
+              f'{choice["name"]} ({choice["acc"]:.4f} acc, {choice["ms1"]:.2f} ms) -> {choice["path"]}')
+    else:
+        print('No candidate met the latency budget and accuracy bar.')
+    return rows
+
+
+def _soften(probs, temperature):
+    # The models end in softmax, so log(probs) are the logits up to a constant,
+    # and softmax(log(probs) / T) is exactly the temperature-scaled distribution
+    return tf.nn.softmax(tf.math.log(tf.clip_by_value(probs, 1e-7, 1.0)) / temperature)
+
+
+def distillation_loss(temperature=4.0, alpha=0.1, num_classes=7):
+    """Loss for targets that are [one-hot labels, teacher probabilities] concatenated.
+
+    alpha * cross-entropy with the true labels + (1 - alpha) * T^2 * KL(teacher_T || student_T),
+    where _T are both distributions softened with temperature T. The T^2 factor
+    keeps the soft-target gradients on the same scale as the hard ones.
+    """
+    def loss(y, student_probs):
+        hard, teacher_probs = y[:, :num_classes], y[:, num_classes:]
+        student = tf.clip_by_value(student_probs, 1e-7, 1.0)
+        hard_loss = -tf.reduce_sum(hard * tf.math.log(student), axis=-1)
+        soft_teacher = _soften(teacher_probs, temperature)
+        soft_student = _soften(student_probs, temperature)
+        kl = tf.reduce_sum(soft_teacher * (tf.math.log(tf.clip_by_value(soft_teacher, 1e-7, 1.0))
+                                           - tf.math.log(tf.clip_by_value(soft_student, 1e-7, 1.0))), axis=-1)
+        return alpha * hard_loss + (1.0 - alpha) * temperature ** 2 * kl
+    return loss
+
+
+def hard_accuracy(y, student_probs, num_classes=7):
+    """Accuracy against the one-hot half of distillation targets."""
+    return tf.cast(tf.equal(tf.argmax(y[:, :num_classes], axis=-1), tf.argmax(student_probs, axis=-1)), tf.float32)
+
+
+def run_distillation(train_ds, val_ds, teacher_path, student, out_path, epochs, batch_size=64, temperature=4.0,
+                     alpha=0.1, eval_workers=1):
+    """Train `student` on the teacher's soft targets plus the true labels and save it to `out_path`.
+
+    The saved student is a plain Keras model with the same inputs and softmax
+    outputs as the teacher, so it can replace emotion_model.h5 anywhere
+    (EMOTION_MODEL_PATH, live_emotion_detection.py --model, export_model.py).
+    """
+    print('Loading teacher:', teacher_path)
+    teacher = tf.keras.models.load_model(teacher_path)
+    teacher.trainable = False
+    num_classes = teacher.output_shape[-1]
+
+    def with_teacher(x, y):
+        # Teacher outputs are computed per batch and appended to the labels
+        return x, tf.concat([tf.cast(y, tf.float32), teacher(x, training=False)], axis=-1)
+
+    distill_train = train_ds.map(with_teacher).prefetch(AUTOTUNE)
+    distill_val = val_ds.map(with_teacher).prefetch(AUTOTUNE)
+
+    student.compile(optimizer='adam', loss=distillation_loss(temperature, alpha, num_classes),
+                    metrics=[hard_accuracy])
+    student.summary()
 
-        history = model.fit(train_ds, epochs=epochs, validation_data=val_ds, callbacks=callbacks)
+    checkpoint_path = os.path.join('models', 'distill_checkpoint.h5')
+    callbacks = [
+        tf.keras.callbacks.ModelCheckpoint(checkpoint_path, monitor='val_hard_accuracy', mode='max',
+                                           save_best_only=True),
+        tf.keras.callbacks.ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=3, min_lr=1e-6),
+        ThroughputCallback(batch_size),
+    ]
+    student.fit(distill_train, epochs=epochs, validation_data=distill_val, callbacks=callbacks)
+
+    # Re-save the best student compiled with the standard loss so it loads without custom objects
+    best = tf.keras.models.load_model(checkpoint_path, compile=False)
+    best.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+    best.save(out_path)
+    os.remove(checkpoint_path)
+
+    print('Comparing teacher and student on the validation set...')
+    print(f"{'model':<8} {'params':>10} {'ms @1':>7} {'ms @32':>7} {'val acc':>8}")
+    for name, model in (('teacher', teacher), ('student', best)):
+        latency = measure_model_latency(model)
+        y_true, probs = collect_predictions(model, val_ds, workers=eval_workers)
+        acc = float(np.mean(np.argmax(probs, axis=1) == y_true))
+        print(f'{name:<8} {model.count_params():>10,} {latency[1]:>7.2f} {latency[32]:>7.2f} {acc:>8.4f}')
+    print(f'Student model saved to {out_path}')
+    return out_path
+
+
+def load_eval_arrays(batch_size=64, calibration_samples=500):
+    """Return (calibration images, validation images, validation labels) as numpy arrays.
+
+    Uses the local `train/` and `test/` folders if present, else FER-2013 via TFDS.
+    Images are float32 in [0,1] with shape (n,48,48,1); labels are class indices.
+    """
+    train_ds, val_ds = load_from_local_dirs(train_dir='train', val_dir='test', image_size=(48, 48), batch_size=batch_size)
+    if train_ds is not None and val_ds is not None:
+        num_batches = (calibration_samples + batch_size - 1) // batch_size
+        calib = np.concatenate([x.numpy() for x, _ in train_ds.take(num_batches)])[:calibration_samples]
+        x_val, y_val = [], []
+        for x_batch, y_batch in val_ds:
+            x_val.append(x_batch.numpy())
+            y_val.append(np.argmax(y_batch.numpy(), axis=1))
+        return calib, np.concatenate(x_val), np.concatenate(y_val)
+
+    x_train, _ = load_fer2013('train')
+    x_val, y_val = load_fer2013('validation')
+    rng = np.random.default_rng(123)
+    idx = rng.choice(len(x_train), size=min(calibration_samples, len(x_train)), replace=False)
+    return preprocess(x_train[idx]), preprocess(x_val), y_val
+
+
+def quantize_int8(model, calibration_images, out_path):
+    """Convert `model` to a full-integer int8 TFLite model calibrated on `calibration_images`."""
+    def representative_dataset():
+        for i in range(len(calibration_images)):
+            yield [calibration_images[i:i+1].astype('float32')]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.int8
+    converter.inference_output_type = tf.int8
+    with open(out_path, 'wb') as f:
+        f.write(converter.convert())
+    return out_path
+
+
+def measure_latency(predict_fn, batch, repeats=50):
+    """Median latency of predict_fn(batch) in milliseconds."""
+    predict_fn(batch)  # warm-up
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        predict_fn(batch)
+        times.append((time.perf_counter() - start) * 1000.0)
+    return float(np.median(times))
+
+
+def predict_in_batches(predict_fn, images, batch_size=256):
+    return np.concatenate([predict_fn(images[i:i+batch_size]) for i in range(0, len(images), batch_size)])
+
+
+def run_quantization(model_path, batch_size=64, calibration_samples=500):
+    """Quantize a trained model to int8 and report size, latency and accuracy changes."""
+    from inference_backends import load_model
+    from export_model import export_tflite
+
+    print('Loading trained model:', model_path)
+    model = tf.keras.models.load_model(model_path)
+
+    print(f'Loading {calibration_samples} calibration images and the validation set...')
+    calib, x_val, y_val = load_eval_arrays(batch_size=batch_size, calibration_samples=calibration_samples)
+
+    stem = os.path.splitext(model_path)[0]
+    float_path = export_tflite(model, stem + '.tflite')
+    int8_path = quantize_int8(model, calib, stem + '_int8.tflite')
+    float_tflite = load_model(float_path)
+    int8_tflite = load_model(int8_path)
+
+    print('Model size:')
+    h5_kb = os.path.getsize(model_path) / 1024
+    float_kb = os.path.getsize(float_path) / 1024
+    int8_kb = os.path.getsize(int8_path) / 1024
+    print(f'  Keras .h5:      {h5_kb:10.1f} KB')
+    print(f'  TFLite float32: {float_kb:10.1f} KB')
+    print(f'  TFLite int8:    {int8_kb:10.1f} KB  ({float_kb / int8_kb:.1f}x smaller than float32)')
+
+    print('CPU latency (median ms):')
+    for n in (1, 32):
+        batch = x_val[:n]
+        keras_ms = measure_latency(lambda b: model(b, training=False), batch)
+        float_ms = measure_latency(float_tflite.predict, batch)
+        int8_ms = measure_latency(int8_tflite.predict, batch)
+        print(f'  batch={n:<3} keras={keras_ms:.3f}  tflite_float32={float_ms:.3f}  tflite_int8={int8_ms:.3f}  '
+              f'(int8 speedup vs float32: {float_ms / int8_ms:.2f}x)')
+
+    print('Evaluating accuracy on the validation set...')
+    y_float = np.argmax(predict_in_batches(lambda b: model.predict(b, verbose=0), x_val), axis=1)
+    y_int8 = np.argmax(predict_in_batches(int8_tflite.predict, x_val), axis=1)
+    float_acc = float(np.mean(y_float == y_val))
+    int8_acc = float(np.mean(y_int8 == y_val))
+    print(f'  float32 acc: {float_acc:.4f}  int8 acc: {int8_acc:.4f}  delta: {int8_acc - float_acc:+.4f}')
+
+    plot_confusion_matrix(y_val, y_int8, labels=EMOTION_LABELS, out_path='confusion_matrix_int8.png')
+    print('Classification report (int8):')
+    print(classification_report(y_val, y_int8, target_names=EMOTION_LABELS))
+    print(f'Quantized model saved to {int8_path}')
 
-        print('Plotting history...')
-        plot_history(history, out_path='training_history.png')
 
-        print('Loading best model and evaluating on validation set...')
-        best = tf.keras.models.load_model('emotion_model.h5')
-        val_loss, val_acc = best.evaluate(val_ds, verbose=1)
-        print(f'Validation loss: {val_loss:.4f}, acc: {val_acc:.4f}')
+def main():
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--epochs', type=int, default=30, help='Number of training epochs')
+    parser.add_argument('--batch_size', type=int, default=64, help='Batch size')
+    parser.add_argument('--quantize', action='store_true', help='Quantize a trained model to int8 instead of training')
+    parser.add_argument('--model', type=str, default='emotion_model.h5', help='Trained model to quantize (with --quantize)')
+    parser.add_argument('--calibration_samples', type=int, default=500, help='Training images used to calibrate int8 ranges')
+    parser.add_argument('--cache_dir', type=str, default='cache', help='Where the TFDS fallback caches decoded FER-2013')
+    parser.add_argument('--compile_dataset', action='store_true',
+                        help='Decode the dataset once into memory-mapped shards in --dataset_cache and exit')
+    parser.add_argument('--arch', type=str, default=None, choices=sorted(ARCHITECTURES),
+                        help='Model architecture: the original Conv2D stack or a depthwise-separable network '
+                             '(default: baseline, or separable with --distill)')
+    parser.add_argument('--width', type=float, default=None,
+                        help='Width multiplier for filter and unit counts (default: 1.0, or 0.5 with --distill)')
+    parser.add_argument('--pooling', type=str, default=None, choices=['flatten', 'gap'],
+                        help='Flatten or global average pooling before the classifier (default depends on --arch)')
+    parser.add_argument('--latency_budget_ms', '--latency-budget-ms', type=float, default=None,
+                        help='Benchmark candidate architectures on this CPU, train those whose batch-1 latency fits '
+                             'the budget, and report accuracy vs. latency')
+    parser.add_argument('--min_accuracy', type=float, default=None,
+                        help='With --latency_budget_ms: accuracy bar for the recommended model')
+    parser.add_argument('--distill', action='store_true',
+                        help='Train a smaller student model on the soft targets of --teacher')
+    parser.add_argument('--teacher', type=str, default='emotion_model.h5', help='Teacher model for --distill')
+    parser.add_argument('--temperature', type=float, default=4.0, help='Softmax temperature for distillation targets')
+    parser.add_argument('--alpha', type=float, default=0.1,
+                        help='Weight of the true-label loss; 1 - alpha goes to matching the teacher')
+    parser.add_argument('--student_out', type=str, default='emotion_model_student.h5',
+                        help='Where the distilled student model is saved')
+    parser.add_argument('--eval_workers', type=int, default=1,
+                        help='Threads running validation batches concurrently (e.g. the number of CPU cores)')
+    parser.add_argument('--dataset_cache', type=str, default=os.path.join('cache', 'compiled'),
+                        help='Compiled dataset used for training when present')
+    args = parser.parse_args()
+    epochs = args.epochs
+    batch_size = args.batch_size
 
-        print('Predicting on validation set for confusion matrix...')
-        # Collect y_true and y_pred across the validation dataset
-        y_true = []
-        for _, y_batch in val_ds:
-            y_true.extend(np.argmax(y_batch.numpy(), axis=1).tolist())
+    if args.quantize:
+        run_quantization(args.model, batch_size=batch_size, calibration_samples=args.calibration_samples)
+        return
 
-        y_pred_probs = best.predict(val_ds)
-        y_pred = np.argmax(y_pred_probs, axis=1)
+    os.makedirs('models', exist_ok=True)
 
-        plot_confusion_matrix(y_true, y_pred, labels=EMOTION_LABELS, out_path='confusion_matrix.png')
-        print('Classification report:')
-        print(classification_report(y_true, y_pred, target_names=EMOTION_LABELS))
-        print('Model saved to emotion_model.h5 (best by val_accuracy).')
+    if args.compile_dataset:
+        compile_datasets(args.dataset_cache)
         return
 
-    # Fall back to tensorflow_datasets if local folders are not present
-    print('Local folders not found; falling back to loading FER-2013 via tensorflow_datasets...')
-    x_train, y_train = load_fer2013('train')
-    x_val, y_val = load_fer2013('validation')
+    # A compiled copy (--compile_dataset) skips decoding entirely
+    train_ds, val_ds = load_compiled_datasets(args.dataset_cache, batch_size=batch_size)
+
+    if train_ds is None or val_ds is None:
+        # Prefer local directory datasets if present (train/ and test/)
+        print('Checking for local `train/` and `test/` directories...')
+        train_ds, val_ds = load_from_local_dirs(train_dir='train', val_dir='test', image_size=(48, 48), batch_size=batch_size)
+        if train_ds is not None and val_ds is not None:
+            print('Found local dataset folders, using them for training.')
+
+    if train_ds is None or val_ds is None:
+        # Fall back to tensorflow_datasets if local folders are not present
+        print('Local folders not found; falling back to streaming FER-2013 via tensorflow_datasets...')
+        train_ds, val_ds = load_fer2013_datasets(batch_size=batch_size, cache_dir=args.cache_dir)
 
-    x_train = preprocess(x_train)
-    x_val = preprocess(x_val)
+    if args.latency_budget_ms is not None:
+        run_architecture_search(train_ds, val_ds, args.latency_budget_ms, epochs,
+                                min_accuracy=args.min_accuracy, eval_workers=args.eval_workers)
+        return
 
-    y_train_cat = to_categorical(y_train, num_classes=7)
-    y_val_cat = to_categorical(y_val, num_classes=7)
+    if args.distill:
+        # Students default to a small depthwise-separable network
+        student = build_model(input_shape=(48, 48, 1), num_classes=7, arch=args.arch or 'separable',
+                              width=args.width or 0.5, pooling=args.pooling)
+        run_distillation(train_ds, val_ds, args.teacher, student, args.student_out, epochs, batch_size=batch_size,
+                         temperature=args.temperature, alpha=args.alpha, eval_workers=args.eval_workers)
+        return
 
-    print('Building model...')
-    model = build_model(input_shape=x_train.shape[1:], num_classes=7)
+    model = build_model(input_shape=(48, 48, 1), num_classes=7, arch=args.arch or 'baseline',
+                        width=args.width or 1.0, pooling=args.pooling)
     model.summary()
 
+    throughput = ThroughputCallback(batch_size)
     callbacks = [
         tf.keras.callbacks.ModelCheckpoint('emotion_model.h5', monitor='val_accuracy', save_best_only=True),
         tf.keras.callbacks.ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=3, min_lr=1e-6),
+        throughput,
     ]
 
-    print('Training...')
-    history = model.fit(x_train, y_train_cat, epochs=epochs, batch_size=batch_size, validation_data=(x_val, y_val_cat), callbacks=callbacks)
+    history = model.fit(train_ds, epochs=epochs, validation_data=val_ds, callbacks=callbacks)
+    if throughput.history:
+        # The first epoch includes filling caches, so report the steady state separately
+        steady = throughput.history[1:] or throughput.history
+        print(f'Training throughput: {np.mean(steady):.0f} images/sec '
+              f'(first epoch: {throughput.history[0]:.0f} images/sec)')
 
     print('Plotting history...')
     plot_history(history, out_path='training_history.png')
 
     print('Loading best model and evaluating on validation set...')
     best = tf.keras.models.load_model('emotion_model.h5')
-    val_loss, val_acc = best.evaluate(x_val, y_val_cat, verbose=1)
-    print(f'Validation loss: {val_loss:.4f}, acc: {val_acc:.4f}')
-
-    print('Predicting on validation set for confusion matrix...')
-    y_pred = np.argmax(best.predict(x_val), axis=1)
-    plot_confusion_matrix(y_val, y_pred, labels=EMOTION_LABELS, out_path='confusion_matrix.png')
-
+    # One pass collects outputs and labels; loss, accuracy, the confusion matrix
+    # and the report are all derived from them
+    start = time.perf_counter()
+    y_true, y_pred_probs = collect_predictions(best, val_ds, workers=args.eval_workers)
+    y_pred = np.argmax(y_pred_probs, axis=1)
+    val_loss = categorical_crossentropy(y_true, y_pred_probs)
+    val_acc = float(np.mean(y_pred == y_true))
+    print(f'Validation loss: {val_loss:.4f}, acc: {val_acc:.4f} '
+          f'({len(y_true)} images in {time.perf_counter() - start:.1f}s)')
+
+    plot_confusion_matrix(y_true, y_pred, labels=EMOTION_LABELS, out_path='confusion_matrix.png')
     print('Classification report:')
-    print(classification_report(y_val, y_pred, target_names=EMOTION_LABELS))
-
+    print(classification_report(y_true, y_pred, target_names=EMOTION_LABELS))
     print('Model saved to emotion_model.h5 (best by val_accuracy).')
 
 
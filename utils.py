@@ -2,10 +2,10 @@
 
 This file provides helpers used by training and live-detection scripts.
 """
-import numpy as np
 import matplotlib.pyplot as plt
 from sklearn.metrics import confusion_matrix, ConfusionMatrixDisplay
 import seaborn as sns
+from face_preprocessing import normalize, to_gray
 
 
 def plot_history(history, out_path=None):
@@ -57,10 +57,6 @@ def preprocess_image(image):
 
     Assumes image is a numpy array.
     """
-    # image expected in shape (h, w) or (h, w, 1)
-    if image.ndim == 3 and image.shape[2] == 3:
-        # convert to grayscale average
-        image = np.mean(image, axis=2)
-    image = image.astype('float32') / 255.0
-    image = np.expand_dims(image, -1)
-    return image
+    # image expected in shape (h, w) or (h, w, 1); color images are converted
+    # with the same BGR->gray weights as everywhere else (see face_preprocessing)
+    return normalize(to_gray(image))